@@ -0,0 +1,84 @@
+# Copyright 2026 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+"""Benchmark the loading of the addons set on a synthetic project tree.
+
+Compares manifestoo's serial ``AddonsSet.add_from_addons_dirs`` with the
+parallel loader used by ``otools-addon``:
+
+    python benchmarks/addons_set.py --addons 5000 --repos 50
+"""
+
+import tempfile
+import time
+from pathlib import Path
+
+import click
+from manifestoo_core.addons_set import AddonsSet
+
+from odoo_tools.utils.manifestoo import load_addons_set
+
+MANIFEST_TMPL = """{{
+    "name": "Addon {idx}",
+    "summary": "Synthetic addon for benchmarking purposes",
+    "version": "18.0.1.0.{idx}",
+    "author": "Camptocamp, Odoo Community Association (OCA)",
+    "license": "AGPL-3",
+    "depends": {depends!r},
+    "data": [
+        "security/ir.model.access.csv",
+        "views/addon_{idx}_views.xml",
+        "data/addon_{idx}_data.xml",
+    ],
+    "external_dependencies": {{"python": ["requests"]}},
+    "installable": True,
+}}
+"""
+
+
+def make_tree(root: Path, addons: int, repos: int) -> list[Path]:
+    """Create ``addons`` fake addons spread over ``repos`` directories."""
+    addons_dirs = [root / f"repo_{idx:03}" for idx in range(repos)]
+    for idx in range(addons):
+        addon_dir = addons_dirs[idx % repos] / f"addon_{idx:05}"
+        addon_dir.mkdir(parents=True)
+        depends = ["base"] + [f"addon_{dep:05}" for dep in range(max(0, idx - 3), idx)]
+        (addon_dir / "__manifest__.py").write_text(
+            MANIFEST_TMPL.format(idx=idx, depends=depends)
+        )
+        (addon_dir / "__init__.py").touch()
+    return addons_dirs
+
+
+def serial_addons_set(addons_dirs: list[Path]) -> AddonsSet:
+    addons_set = AddonsSet()
+    addons_set.add_from_addons_dirs(addons_dirs)
+    return addons_set
+
+
+def best_of(func, *args, rounds: int) -> tuple[float, AddonsSet]:
+    timings = []
+    for __ in range(rounds):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+@click.command()
+@click.option("--addons", default=5000, show_default=True)
+@click.option("--repos", default=50, show_default=True)
+@click.option("--rounds", default=5, show_default=True)
+def main(addons, repos, rounds):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        addons_dirs = make_tree(Path(tmp_dir), addons, repos)
+        serial, expected = best_of(serial_addons_set, addons_dirs, rounds=rounds)
+        parallel, result = best_of(load_addons_set, addons_dirs, rounds=rounds)
+    assert result.keys() == expected.keys()
+    click.echo(f"{addons} addons in {repos} directories (best of {rounds}):")
+    click.echo(f"  AddonsSet.add_from_addons_dirs: {serial * 1000:8.1f} ms")
+    click.echo(f"  load_addons_set:                {parallel * 1000:8.1f} ms")
+    click.echo(f"  speedup:                        {serial / parallel:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
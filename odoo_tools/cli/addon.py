@@ -4,13 +4,12 @@
 
 import click
 
+from ..utils import git as git_utils
 from ..utils import manifestoo as manifestoo_utils
 from ..utils import req as req_utils
 from ..utils import ui
 from ..utils.click import global_command_decorators
-from ..utils.config import config
 from ..utils.misc import SmartDict
-from ..utils.path import build_path, is_odoo_module
 from ..utils.proj import get_odoo_serie
 from ..utils.pypi import odoo_name_to_pkg_name
 
@@ -80,30 +79,45 @@ def add_requirement(name, **kw):
 
 
 @cli.command()
-@click.argument("name")
-def where(name):
-    """Locate an addon by name across the project's addon directories."""
-    search_paths = []
-    local_src = build_path(config.local_src_rel_path)
-    ext_src = build_path(config.ext_src_rel_path)
-    odoo_src = build_path(config.odoo_src_rel_path)
-    # local-src: direct children
-    search_paths.append(local_src / name)
-    # external-src: children of subdirectories (each subdir is a repo)
-    if ext_src.is_dir():
-        for repo_dir in sorted(ext_src.iterdir()):
-            if repo_dir.is_dir():
-                search_paths.append(repo_dir / name)
-    # Odoo community addons
-    search_paths.append(odoo_src / "addons" / name)
-    # Odoo base addons
-    search_paths.append(odoo_src / "odoo" / "addons" / name)
-
-    found = [path for path in search_paths if is_odoo_module(path)]
-    if not found:
-        ui.exit_msg(f"Addon '{name}' not found")
-    for path in found:
-        click.echo(path)
+@click.argument("names", nargs=-1)
+@click.option(
+    "--duplicates",
+    is_flag=True,
+    help="Only report the addons found in several locations.",
+)
+def where(names, duplicates):
+    """Locate addons by name across the project's addon directories.
+
+    Several names can be given at once, as well as glob patterns (e.g:
+    'sale_*'). With --duplicates, the addons found in several locations are
+    reported, along with all of these locations: they are shadowing each
+    other in the addons path.
+    """
+    if not names and not duplicates:
+        raise click.UsageError("Missing addon name(s), or --duplicates.")
+    index = manifestoo_utils.get_addons_index()
+    found = {}
+    missing = []
+    for name in names:
+        if matches := index.find(name):
+            found.update(matches)
+        else:
+            missing.append(name)
+    if duplicates:
+        if names:
+            found = {name: paths for name, paths in found.items() if len(paths) > 1}
+        else:
+            found = index.duplicates
+        for name, paths in sorted(found.items()):
+            click.echo(name)
+            for path in paths:
+                click.echo(f"  {path}")
+    else:
+        for paths in found.values():
+            for path in paths:
+                click.echo(path)
+    if missing:
+        ui.exit_msg(f"Addon(s) not found: {', '.join(missing)}")
 
 
 @cli.command(name="list")
@@ -225,5 +239,31 @@ def codepends(addons, transitive, include_selected, ignore_missing, quiet, separ
         click.echo((separator or "\n").join(addon_names))
 
 
+@cli.command()
+@click.argument("rev_range", required=False)
+@click.option(
+    "--separator",
+    help="Separator to join the addon names with (by default, print one per line).",
+)
+def impacted(rev_range, separator):
+    """List the addons impacted by the changes of a git revision range.
+
+    These are the addons owning the changed files, along with all the addons
+    depending on them: the minimal set of addons to install and test.
+    Without REV_RANGE, the uncommitted changes are considered.
+
+    For example, to select the addons to test on a pull request:
+
+        otools-addon impacted origin/16.0...HEAD --separator ,
+    """
+    changed_paths = git_utils.get_changed_files(rev_range)
+    addons_set = manifestoo_utils.get_addons_set()
+    changed_addons = manifestoo_utils.get_changed_addons(changed_paths, addons_set)
+    graph = manifestoo_utils.DependencyGraph(addons_set)
+    addon_names = sorted(changed_addons | graph.codepends(changed_addons))
+    if addon_names:
+        click.echo((separator or "\n").join(addon_names))
+
+
 if __name__ == "__main__":
     cli()
@@ -2,11 +2,11 @@
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
 import json
+import re
 from datetime import datetime
 from pathlib import Path
 
 import click
-import psycopg2
 from rich.console import Console
 from rich.table import Table
 
@@ -14,6 +14,9 @@ from .. import utils
 
 console = Console()
 
+#: Values accepted by ``pg_dump --compress``
+COMPRESS_RE = re.compile(r"\d|(gzip|lz4|zstd|none)(:\d+)?")
+
 
 @click.group()
 @utils.click.global_command_decorators
@@ -38,26 +41,17 @@ def list():
 
 
 @cli.command("list-versions")
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Query every database, instead of reusing the versions of the "
+    "databases not written to since the last listing.",
+)
+@utils.click.jobs_option
 @utils.click.handle_exceptions()
-def list_versions():
+def list_versions(no_cache=False, jobs=utils.click.DEFAULT_MAX_WORKERS):
     """Print a table of DBs with Marabunta version and install date."""
-    res = {}
-    for db_name in utils.db.get_db_list():
-        try:
-            version_fetch = utils.db.execute_db_request(
-                db_name,
-                """
-                SELECT date_done, number
-                FROM marabunta_version
-                ORDER BY date_done DESC
-                LIMIT 1;
-                """,
-            )
-            version_tuple = version_fetch[0] if version_fetch else (None, None)
-        except psycopg2.ProgrammingError:
-            # Error expected when marabunta_version table does not exist
-            version_tuple = (None, None)
-        res[db_name] = version_tuple
+    res = utils.db.get_marabunta_versions(use_cache=not no_cache, max_workers=jobs)
     # Early return if no databases found
     if not res:
         click.echo("No databases found")
@@ -72,6 +66,25 @@ def list_versions():
     console.print(table)
 
 
+def _parse_budget(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return utils.db_template.parse_size(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e)) from e
+
+
+def budget_option(**kwargs):
+    return click.option(
+        "--budget",
+        callback=_parse_budget,
+        help="Disk size of the template pool, e.g: 20G. The least recently used "
+        "templates are dropped to fit in it.",
+        **kwargs,
+    )
+
+
 @cli.command()
 @click.argument("dump_path", type=click.Path(exists=True, readable=True))
 @click.option(
@@ -82,24 +95,71 @@ def list_versions():
     "--create-template/--no-create-template",
     help="Create a template database for faster restores in the future.",
 )
+@click.option(
+    "--template-pool",
+    is_flag=True,
+    help="Restore the dump through the template pool: it's restored once into a "
+    "template, which is cloned on the next restores.",
+)
+@budget_option()
+@click.option(
+    "--incremental-filestore",
+    is_flag=True,
+    help="Only copy the filestore files missing from the existing filestore "
+    "of the database (zip archives only).",
+)
+@utils.click.pg_jobs_option
 @utils.click.handle_exceptions()
-def restore(dump_path, db_name=None, create_template=False):
+def restore(
+    dump_path,
+    db_name=None,
+    create_template=False,
+    template_pool=False,
+    budget=None,
+    incremental_filestore=False,
+    jobs=None,
+):
     """Restore an odoo backup locally (sql, dump or zip archive)
 
-    If it's a zip archive, and if it contains a filestore, it will also be restored.
+    If it's a zip archive, and if it contains a filestore, it will also be restored,
+    along with the database.
+    Custom and directory format dumps are restored with parallel jobs.
     """
+    is_archive = Path(dump_path).suffix == ".zip"
+    if template_pool and (create_template or is_archive):
+        raise click.UsageError(
+            "--template-pool can't be used with --create-template or zip archives."
+        )
     # Use filename without extension as db name by default
     if not db_name:
         db_name = Path(dump_path).stem
+    if template_pool:
+        return utils.db_template.create_db_from_pool(
+            db_name, dump_path, jobs=jobs, budget=budget
+        )
     # Create database
     template_db_name = create_template and f"{db_name}-template" or None
     # If .zip, we're dealing with an Odoo archive format
-    if Path(dump_path).suffix == ".zip":
+    if is_archive:
         return utils.db.create_db_from_odoo_archive(
-            db_name, dump_path, template_db_name
+            db_name,
+            dump_path,
+            template_db_name,
+            incremental_filestore=incremental_filestore,
         )
     # Otherwise we handle as a dump file
-    return utils.db.create_db_from_db_dump(db_name, dump_path, template_db_name)
+    return utils.db.create_db_from_db_dump(
+        db_name, dump_path, template_db_name, jobs=jobs
+    )
+
+
+def _validate_compress(ctx, param, value):
+    if value is not None and not COMPRESS_RE.fullmatch(value):
+        raise click.BadParameter(
+            "expected a level (0-9), a method (gzip, lz4, zstd, none) "
+            "or a method and a level, e.g: zstd:3."
+        )
+    return value
 
 
 @cli.command()
@@ -107,12 +167,19 @@ def restore(dump_path, db_name=None, create_template=False):
 @click.argument("output_path", default=".", type=click.Path(exists=False))
 @click.option(
     "--format",
-    type=click.Choice(["c", "p"]),
+    type=click.Choice(["c", "p", "d"]),
     default="c",
-    help="Format of the dump (c: custom, p: plain)",
+    help="Format of the dump (c: custom, p: plain, d: directory)",
+)
+@click.option(
+    "--compress",
+    callback=_validate_compress,
+    help="Compression method and/or level, e.g: 6, zstd:3 or lz4. "
+    "zstd and lz4 need PostgreSQL 16 or newer.",
 )
+@utils.click.pg_jobs_option
 @utils.click.handle_exceptions()
-def dump(db_name, output_path, format):
+def dump(db_name, output_path, format, compress=None, jobs=None):
     """Create a PostgreSQL dump of the specified database.
 
     DB_NAME: Name of the database to dump.
@@ -121,8 +188,67 @@ def dump(db_name, output_path, format):
     OUTPUT_PATH: Path of the file or directory to save the dump.
     If it's a directory, the filename will be automatically generated.
     Defaults to the current directory.
+
+    Directory format dumps are made with parallel jobs.
+    """
+    if jobs and format != "d":
+        raise click.UsageError("--jobs is only supported with --format d.")
+    utils.db.dump_db(db_name, output_path, format, jobs=jobs, compress=compress)
+
+
+@cli.group()
+def template():
+    """Template pool management commands."""
+    pass
+
+
+@template.command("list")
+@utils.click.handle_exceptions()
+def template_list():
+    """List the templates of the pool, the most recently used first."""
+    templates = utils.db_template.list_templates()
+    if not templates:
+        click.echo("No templates found")
+        return
+    table = Table("Name", "Dump", "Size", "Created", "Last used")
+    for tpl in reversed(templates):
+        created, last_used = (
+            date.strftime("%Y-%m-%d %H:%M") if date else None
+            for date in (tpl.created, tpl.last_used)
+        )
+        table.add_row(
+            tpl.name,
+            tpl.dump or "[red](incomplete)[/]",
+            f"{tpl.size / 1024**3:.1f} GiB",
+            created,
+            last_used,
+        )
+    console.print(table)
+
+
+@template.command("create")
+@click.argument("dump_path", type=click.Path(exists=True, readable=True))
+@budget_option()
+@utils.click.pg_jobs_option
+@utils.click.handle_exceptions()
+def template_create(dump_path, budget=None, jobs=None):
+    """Create the template of a dump, unless the pool already has it."""
+    tpl = utils.db_template.get_template(dump_path, jobs=jobs)
+    if budget is not None:
+        utils.db_template.gc(budget, keep=[tpl.name])
+
+
+@template.command("gc")
+@budget_option(required=True)
+@utils.click.handle_exceptions()
+def template_gc(budget):
+    """Drop the least recently used templates over the budget.
+
+    Incomplete templates, left by interrupted restores, are dropped too.
     """
-    utils.db.dump_db(db_name, output_path, format)
+    dropped = utils.db_template.gc(budget)
+    if not dropped:
+        click.echo("Nothing to drop")
 
 
 @cli.group()
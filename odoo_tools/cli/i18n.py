@@ -1,50 +1,404 @@
 # Copyright 2025 Camptocamp SA (https://www.camptocamp.com).
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+import hashlib
+import json
 import os
+import re
+import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import click
 from rich.console import Console
+from rich.progress import Progress
 
 from .. import utils
+from ..utils import manifestoo as manifestoo_utils
 from ..utils.proj import get_odoo_serie
 
 console = Console()
 
 
-def _build_odoo_i18n_export_cmd(module_name, language, database, export_path):
-    """Build the odoo command to export i18n files."""
-    # Starting from Odoo 19.0, the --i18n-export flag was replaced by a
-    # dedicated `odoo i18n export` subcommand.
+#: Suffixes of the module files the translatable terms are read from
+I18N_SOURCE_SUFFIXES = {".py", ".xml", ".csv", ".js"}
+
+#: Header lines of the translation files updated on every export
+I18N_PO_DATES_RE = re.compile(rb'^"(POT-Creation|PO-Revision)-Date: .*$', re.MULTILINE)
+
+#: File of the module i18n directories recording the digest of the module
+#: sources each translation file was exported from
+I18N_DIGEST_FILENAME = ".otools-i18n.json"
+
+#: Start of the source of the translation databases in the template pool
+I18N_TEMPLATE_SOURCE = "i18n of "
+
+#: Printed by the script after each exported file, followed by its path
+I18N_EXPORTED_MARKER = "otools-i18n-exported:"
+
+#: Script run in ``odoo shell`` to export the translation files of several
+#: modules and languages at once, loading the registry a single time. It is
+#: the export done by ``--i18n-export`` (and ``odoo i18n export`` since 19.0).
+I18N_EXPORT_SCRIPT = """
+import inspect
+import json
+
+from odoo.tools.translate import trans_export
+
+# Depending on the Odoo version, the export takes a cursor or an environment
+target = env if "env" in inspect.signature(trans_export).parameters else env.cr
+for module_name, language, export_path in json.loads({exports!r}):
+    with open(export_path, "wb") as buffer:
+        trans_export(language, [module_name], buffer, "po", target)
+    print({marker!r} + export_path, flush=True)
+"""
+
+
+def _build_odoo_i18n_export_script(exports):
+    """Build the odoo shell script to export i18n files.
+
+    :param exports: list of ``(module_name, language, export_path)``, where
+        a ``None`` language stands for the pot file
+    """
+    exports = [
+        (module_name, language, str(export_path))
+        for module_name, language, export_path in exports
+    ]
+    return I18N_EXPORT_SCRIPT.format(
+        exports=json.dumps(exports), marker=I18N_EXPORTED_MARKER
+    )
+
+
+def _export_shard(exports, local_volume_path, local_user_id, on_exported):
+    """Export i18n files from an odoo shell, in a container of its own
+
+    :param exports: list of ``(local_path, language, i18n_rel_path)``
+    :param local_volume_path: directory mounted onto the container, where the
+        files are exported to
+    :param on_exported: called with the ``i18n_rel_path`` of each exported file
+    """
+    container_volume_path = Path("/tmp/otools_i18n")
+    for _local_path, _language, i18n_rel_path in exports:
+        (local_volume_path / i18n_rel_path.parent).mkdir(parents=True, exist_ok=True)
+    script_path = local_volume_path / "export.py"
+    script_path.write_text(
+        _build_odoo_i18n_export_script(
+            (local_path.name, language, container_volume_path / i18n_rel_path)
+            for local_path, language, i18n_rel_path in exports
+        )
+    )
+    command = utils.docker_compose.run(
+        "odoo",
+        [
+            "sh",
+            "-c",
+            'odoo shell --log-level=warn --database="$0" < "$1"',
+            "tmp_generate_pot",
+            str(container_volume_path / script_path.name),
+        ],
+        environment={
+            "DEMO": "True",
+            "MIGRATE": "False",
+            "LOCAL_USER_ID": local_user_id,
+        },
+        volumes=[(local_volume_path, container_volume_path)],
+        tty=True,
+    )
+    output = []
+    with subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        env=utils.os_exec.get_venv(),
+    ) as process:
+        assert process.stdout is not None
+        for line in process.stdout:
+            if line.startswith(I18N_EXPORTED_MARKER):
+                export_path = Path(line.removeprefix(I18N_EXPORTED_MARKER).strip())
+                on_exported(export_path.relative_to(container_volume_path))
+            else:
+                output.append(line)
+    if process.returncode:
+        utils.ui.echo("".join(output), err=True, nl=False)
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def _export(exports, local_user_id, jobs=1):
+    """Export i18n files to the local module directories
+
+    :param exports: list of ``(local_path, language, i18n_rel_path)``
+    :param jobs: number of odoo shells to spread the exports over
+    """
+    # Export the files from a single odoo shell, or spread them over `jobs`
+    # workers, all reading the same translation database
+    shards = [exports[idx::jobs] for idx in range(min(jobs, len(exports)))]
+    with (
+        tempfile.TemporaryDirectory() as tmp_dir,
+        Progress(console=console, transient=True) as progress,
+    ):
+        task = progress.add_task("Exporting translation files", total=len(exports))
+
+        def on_exported(i18n_rel_path):
+            progress.update(task, advance=1, description=i18n_rel_path.as_posix())
+
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [
+                executor.submit(
+                    _export_shard,
+                    shard,
+                    Path(tmp_dir, f"worker{idx}"),
+                    local_user_id,
+                    on_exported,
+                )
+                for idx, shard in enumerate(shards)
+            ]
+            for future in futures:
+                future.result()
+        # Move the files to the local module directories, once all the workers
+        # are done, in the order of the modules and languages
+        for position, (local_path, _language, i18n_rel_path) in enumerate(exports):
+            worker = f"worker{position % len(shards)}"
+            source_file = Path(tmp_dir, worker, i18n_rel_path)
+            target_file = local_path / "i18n" / i18n_rel_path.name
+            target_file.parent.mkdir(parents=True, exist_ok=True)
+            if not source_file.exists():
+                raise FileNotFoundError(source_file.as_posix())
+            elif not source_file.is_file():
+                raise IsADirectoryError(source_file.as_posix())
+            source_file.replace(target_file)
+
+
+def _hash_module_files(digest, module_path, suffixes, po_names=None):
+    """Update the digest with the module files having the given suffixes
+
+    Translation files are hashed without their dates, which change on every
+    export. With ``po_names``, only the translation files of these names are.
+    """
+    for path in sorted(module_path.rglob("*")):
+        if not path.is_file() or path.suffix not in suffixes:
+            continue
+        if path.suffix == ".po" and po_names is not None and path.name not in po_names:
+            continue
+        content = path.read_bytes()
+        if path.suffix == ".po":
+            content = I18N_PO_DATES_RE.sub(b"", content)
+        digest.update(f"\0{path.relative_to(module_path)}\0".encode())
+        digest.update(hashlib.sha256(content).digest())
+
+
+def _get_i18n_fingerprint(module_paths, languages):
+    """Return a hash of what a translation database is initialized from
+
+    That is the Odoo serie, the languages, and the sources of the modules and
+    of all their dependencies, including the translation files of the
+    languages loaded into the database. Dependencies that are not found in
+    the project's addons directories are only identified by their name.
+    """
+    local_paths = {
+        local_path.name: local_path
+        for local_path in map(utils.path.build_path, module_paths)
+    }
+    addons_set = manifestoo_utils.get_addons_index().addons_set
+    depends = manifestoo_utils.DependencyGraph(addons_set).depends(
+        local_paths, transitive=True
+    )
+    # Odoo loads the translation files of the language, and of its base one
+    po_names = {
+        f"{code}.po" for lang in languages for code in (lang.split("_")[0], lang)
+    }
+    digest = hashlib.sha256()
+    digest.update(f"{get_odoo_serie()}:{','.join(languages)}".encode())
+    for name in sorted(depends | local_paths.keys()):
+        digest.update(f"\0{name}".encode())
+        if name in local_paths:
+            module_path = local_paths[name]
+        elif name in addons_set:
+            module_path = addons_set[name].path
+        else:
+            continue
+        _hash_module_files(
+            digest, module_path, I18N_SOURCE_SUFFIXES | {".po"}, po_names
+        )
+    return digest.hexdigest()
+
+
+def _get_module_digest(module_path):
+    """Return a hash of the module sources the translatable terms are read from"""
+    digest = hashlib.sha256(get_odoo_serie().encode())
+    _hash_module_files(digest, Path(module_path), I18N_SOURCE_SUFFIXES)
+    return digest.hexdigest()
+
+
+def _read_module_digests(module_path) -> dict[str, str]:
+    """Return the digests of the module sources its translation files were
+    exported from, by file name"""
+    digest_path = Path(module_path, "i18n", I18N_DIGEST_FILENAME)
+    try:
+        return json.loads(digest_path.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_module_digests(module_path, digests: dict[str, str]):
+    digest_path = Path(module_path, "i18n", I18N_DIGEST_FILENAME)
+    digest_path.write_text(json.dumps(digests, indent=2, sort_keys=True) + "\n")
+
+
+def _list_exports(module_paths, export_languages):
+    """Return the files to export, by module and language
+
+    :return: list of ``(local_path, language, i18n_rel_path)``
+    """
+    exports = []
+    for module_path in module_paths:
+        # Local path to the module
+        local_path = utils.path.build_path(module_path)
+        module_name = local_path.name
+        for language in export_languages:
+            # We remove the suffix indicating the language variant, if any.
+            i18n_filename = (
+                f"{module_name}.pot"
+                if language is None
+                else f"{language.split('_')[0]}.po"
+            )
+            exports.append((local_path, language, Path(module_name, i18n_filename)))
+    return exports
+
+
+def _skip_up_to_date(exports, module_digests):
+    """Return the exports, without the files already exported from the current
+    sources of their module"""
+    remaining = []
+    for local_path, language, i18n_rel_path in exports:
+        target_file = local_path / "i18n" / i18n_rel_path.name
+        digests = _read_module_digests(local_path)
+        if (
+            target_file.is_file()
+            and digests.get(target_file.name) == module_digests[local_path]
+        ):
+            console.print(
+                f"⏭️  {target_file.relative_to(Path.cwd()).as_posix()} is up to date"
+            )
+            continue
+        remaining.append((local_path, language, i18n_rel_path))
+    return remaining
+
+
+def _record_module_digests(exports, module_digests):
+    """Record the digest of the module sources the files were exported from"""
+    for local_path in dict.fromkeys(local_path for local_path, _, _ in exports):
+        digests = _read_module_digests(local_path)
+        for export_path, _language, i18n_rel_path in exports:
+            if export_path == local_path:
+                digests[i18n_rel_path.name] = module_digests[local_path]
+        _save_module_digests(local_path, digests)
+
+
+def _get_i18n_template_source(module_names, languages):
+    """Return the source of the translation database of the template pool
+    initialized with the given modules and languages"""
+    return (
+        f"{I18N_TEMPLATE_SOURCE}{', '.join(sorted(module_names))} "
+        f"({', '.join(languages)})"
+    )
+
+
+def _drop_superseded_templates(template):
+    """Drop the translation databases of the pool initialized with the same
+    modules and languages as the given one, from previous sources
+
+    Keeping them would leave a full database behind for every change of the
+    sources. Those of other modules or languages are left to the pool's
+    garbage collection.
+    """
+    for other in utils.db_template.list_templates():
+        if other.dump == template.dump and other.name != template.name:
+            console.print(f"🗑️  Dropping template {other.name} ({other.dump})")
+            utils.db_template.drop_template(other.name)
+
+
+def _init_db(database, module_names, languages, local_user_id):
+    """Initialize a translation database with the given modules and languages"""
     odoo_serie = int(get_odoo_serie())
     if odoo_serie >= 19:
-        odoo_cmd = [
-            "odoo",
-            "i18n",
-            "export",
-            "--database",
-            database,
-            "--languages",
-            language if language is not None else "pot",
-            "--output",
-            str(export_path),
-            module_name,
-        ]
+        # Odoo 19+ — the boot-time `--load-language=<codes>` flag still
+        # exists (see odoo/tools/config.py and modules/loading.py) but
+        # does not reliably activate the `res.lang` records in the
+        # fresh temp database. The subsequent `odoo i18n export` then
+        # fires `Ignoring not found languages: <code>` and produces
+        # nothing. Odoo 19 introduces a dedicated
+        # `odoo i18n loadlang -l <codes>` subcommand (see
+        # odoo/cli/i18n.py:_loadlang) that searches `res.lang` with
+        # `active_test=False` and explicitly activates the language
+        # records — which is what we want here. So split the init
+        # into two docker compose runs: first init the modules,
+        # then activate the languages via the new subcommand.
+        utils.os_exec.run(
+            utils.docker_compose.run(
+                "odoo",
+                [
+                    "odoo",
+                    "--log-level=warn",
+                    "--workers=0",
+                    f"--database={database}",
+                    "--stop-after-init",
+                    f"--init={','.join(module_names)}",
+                ],
+                environment={
+                    "DEMO": "True",
+                    "MIGRATE": "False",
+                    "LOCAL_USER_ID": local_user_id,
+                },
+                quiet=False,
+            ),
+            check=True,
+        )
+        utils.os_exec.run(
+            utils.docker_compose.run(
+                "odoo",
+                [
+                    "odoo",
+                    "i18n",
+                    "loadlang",
+                    "--database",
+                    database,
+                    "-l",
+                    *languages,
+                ],
+                environment={
+                    "DEMO": "True",
+                    "MIGRATE": "False",
+                    "LOCAL_USER_ID": local_user_id,
+                },
+                quiet=False,
+            ),
+            check=True,
+        )
     else:
-        odoo_cmd = [
-            "odoo",
-            "--log-level=warn",
-            "--workers=0",
-            f"--database={database}",
-            "--stop-after-init",
-            f"--i18n-export={export_path}",
-            f"--modules={module_name}",
-        ]
-        if language is not None:
-            odoo_cmd.append(f"--language={language}")
-    return odoo_cmd
+        utils.os_exec.run(
+            utils.docker_compose.run(
+                "odoo",
+                [
+                    "odoo",
+                    "--log-level=warn",
+                    "--workers=0",
+                    f"--database={database}",
+                    f"--load-language={','.join(languages)}",
+                    "--stop-after-init",
+                    f"--init={','.join(module_names)}",
+                ],
+                environment={
+                    "DEMO": "True",
+                    "MIGRATE": "False",
+                    "LOCAL_USER_ID": local_user_id,
+                },
+                quiet=False,
+            ),
+            check=True,
+        )
 
 
 @click.group()
@@ -79,8 +433,30 @@ def cli():
     help="Initialize the translation database before exporting",
 )
 @click.option("--export-pot/--no-export-pot", default=False, help="Export the pot file")
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of Odoo processes to spread the export over.",
+)
+@click.option(
+    "--db-cache/--no-db-cache",
+    default=True,
+    help="Clone the translation database initialized by a previous export for "
+    "the same modules, languages and module sources, instead of initializing it. "
+    "Only applies when cleaning and initializing the database.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Export the translation files of all the modules, even those whose "
+    "sources didn't change since their last export.",
+)
 @utils.click.handle_exceptions()
-def export(module_paths, languages, clean_db, init_db, export_pot):
+def export(
+    module_paths, languages, clean_db, init_db, export_pot, jobs, db_cache, force
+):
     """Export the translation files for a given module."""
     # Run Odoo in the container as the current host user, so the exported
     # translation files end up owned by us instead of the container's default
@@ -114,10 +490,22 @@ def export(module_paths, languages, clean_db, init_db, export_pot):
         export_languages = (None, *export_languages)
     if not export_languages:
         raise click.ClickException("Please specify at least one language.")
+    exports = _list_exports(module_paths, export_languages)
+    # Skip the files exported from the current sources of their module. All
+    # the modules are still installed in the translation database, so that it
+    # is the same whatever the modules to export again.
+    module_digests = {
+        local_path: _get_module_digest(local_path)
+        for local_path in dict.fromkeys(local_path for local_path, _, _ in exports)
+    }
+    if not force:
+        exports = _skip_up_to_date(exports, module_digests)
+        if not exports:
+            return
     # Cleanup the translation database if it already exists, to re-load languages
     if clean_db:
         with console.status("Cleaning up translation database..."):
-            utils.os_exec.run(utils.docker_compose.drop_db("tmp_generate_pot"))
+            utils.db.drop_database("tmp_generate_pot")
     else:
         console.print(
             "⚠️ Not cleaning up translation database may cause wrong terms "
@@ -125,147 +513,34 @@ def export(module_paths, languages, clean_db, init_db, export_pot):
             style="yellow",
         )
     # Initialize the translation database with the terms
-    if init_db:
+    if init_db and clean_db and db_cache:
+        # Clone the database initialized for the same modules, languages and
+        # module sources by a previous export, if any
+        fingerprint = _get_i18n_fingerprint(module_paths, languages)
+        template = utils.db_template.ensure_template(
+            utils.db_template.get_template_name(fingerprint),
+            source=_get_i18n_template_source(module_names, languages),
+            create=lambda name: _init_db(name, module_names, languages, local_user_id),
+        )
+        _drop_superseded_templates(template)
+        with console.status("Cloning the translation database..."):
+            utils.db.create_db_from_db_template("tmp_generate_pot", template.name)
+    elif init_db:
         with console.status(
             f"Initializing Odoo database for i18n export: {', '.join(module_names)}"
         ):
-            odoo_serie = int(get_odoo_serie())
-            if odoo_serie >= 19:
-                # Odoo 19+ — the boot-time `--load-language=<codes>` flag still
-                # exists (see odoo/tools/config.py and modules/loading.py) but
-                # does not reliably activate the `res.lang` records in the
-                # fresh temp database. The subsequent `odoo i18n export` then
-                # fires `Ignoring not found languages: <code>` and produces
-                # nothing. Odoo 19 introduces a dedicated
-                # `odoo i18n loadlang -l <codes>` subcommand (see
-                # odoo/cli/i18n.py:_loadlang) that searches `res.lang` with
-                # `active_test=False` and explicitly activates the language
-                # records — which is what we want here. So split the init
-                # into two docker compose runs: first init the modules,
-                # then activate the languages via the new subcommand.
-                utils.os_exec.run(
-                    utils.docker_compose.run(
-                        "odoo",
-                        [
-                            "odoo",
-                            "--log-level=warn",
-                            "--workers=0",
-                            "--database=tmp_generate_pot",
-                            "--stop-after-init",
-                            f"--init={','.join(module_names)}",
-                        ],
-                        environment={
-                            "DEMO": "True",
-                            "MIGRATE": "False",
-                            "LOCAL_USER_ID": local_user_id,
-                        },
-                        quiet=False,
-                    ),
-                    check=True,
-                )
-                utils.os_exec.run(
-                    utils.docker_compose.run(
-                        "odoo",
-                        [
-                            "odoo",
-                            "i18n",
-                            "loadlang",
-                            "--database",
-                            "tmp_generate_pot",
-                            "-l",
-                            *languages,
-                        ],
-                        environment={
-                            "DEMO": "True",
-                            "MIGRATE": "False",
-                            "LOCAL_USER_ID": local_user_id,
-                        },
-                        quiet=False,
-                    ),
-                    check=True,
-                )
-            else:
-                utils.os_exec.run(
-                    utils.docker_compose.run(
-                        "odoo",
-                        [
-                            "odoo",
-                            "--log-level=warn",
-                            "--workers=0",
-                            "--database=tmp_generate_pot",
-                            f"--load-language={','.join(languages)}",
-                            "--stop-after-init",
-                            f"--init={','.join(module_names)}",
-                        ],
-                        environment={
-                            "DEMO": "True",
-                            "MIGRATE": "False",
-                            "LOCAL_USER_ID": local_user_id,
-                        },
-                        quiet=False,
-                    ),
-                    check=True,
-                )
+            _init_db("tmp_generate_pot", module_names, languages, local_user_id)
     else:
         console.print(
             "🚨 Not initializing Odoo database. We're not even checking the modules "
             "are installed, or that their terms ar up to date. Use at your own risk, "
             "and only if you are sure the database is up to date."
         )
-    # Export module by module and language by language
-    # TODO: Find a faster way to do this? Parallelize?
-    for idx, module_path in enumerate(module_paths):
-        # Local path to the module
-        local_path = utils.path.build_path(module_path)
-        module_name = local_path.name
-        progress = f"{idx + 1}/{len(module_paths)}"
-        # Create a temporary directory to mount onto the container as volume
-        with console.status(f"({progress}) {module_name}...") as status:
-            with tempfile.TemporaryDirectory() as tmp_dir:
-                # Export the translation files
-                local_volume_path = Path(tmp_dir)
-                container_volume_path = Path("/tmp/otools_i18n")
-                for language in export_languages:
-                    # We remove the suffix indicating the language variant, if any.
-                    i18n_filename = (
-                        f"{module_name}.pot"
-                        if language is None
-                        else f"{language.split('_')[0]}.po"
-                    )
-                    i18n_rel_path = Path(module_name) / "i18n" / i18n_filename
-                    status.update(f"({progress}) {i18n_rel_path}...")
-                    odoo_cmd = _build_odoo_i18n_export_cmd(
-                        module_name=module_name,
-                        language=language,
-                        database="tmp_generate_pot",
-                        export_path=container_volume_path / i18n_filename,
-                    )
-                    utils.os_exec.run(
-                        utils.docker_compose.run(
-                            "odoo",
-                            odoo_cmd,
-                            environment={
-                                "DEMO": "True",
-                                "MIGRATE": "False",
-                                "LOCAL_USER_ID": local_user_id,
-                            },
-                            volumes=[(local_volume_path, container_volume_path)],
-                        ),
-                        check=True,
-                    )
-                    # Move the file to the local module directory
-                    source_file = local_volume_path / i18n_filename
-                    target_file = local_path / "i18n" / i18n_filename
-                    target_file.parent.mkdir(parents=True, exist_ok=True)
-                    if not source_file.exists():
-                        raise FileNotFoundError(source_file.as_posix())
-                    elif not source_file.is_file():
-                        raise IsADirectoryError(source_file.as_posix())
-                    source_file.replace(target_file)
-                    # Print a message
-                    console.print(
-                        f"✅ {target_file.relative_to(Path.cwd()).as_posix()}"
-                    )
+    _export(exports, local_user_id, jobs=jobs)
+    for local_path, _language, i18n_rel_path in exports:
+        target_file = local_path / "i18n" / i18n_rel_path.name
+        console.print(f"✅ {target_file.relative_to(Path.cwd()).as_posix()}")
+    _record_module_digests(exports, module_digests)
 
 
 if __name__ == "__main__":
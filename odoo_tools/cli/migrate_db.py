@@ -20,30 +20,121 @@ The migration is composed of the following steps:
     - dump_odoo_migrated        Dump Odoo S.A. migrated DB in a Pg logical format (.pg)
     - migrate_c2c_{step}        Run C2C migration scripts on Odoo S.A. migrated DB
     - dump_c2c_migrated         Dump C2C migrated DB
+
+The progress of the migration is kept in a state file of the store path,
+recording for each step the inputs it ran with, the checksums of its outputs
+and its duration. On the next run, a step is skipped as long as its inputs
+are the same and its outputs are still there. Re-running a step invalidates
+the steps using its outputs. Steps that don't depend on each other (e.g: the
+dump of the Odoo S.A. migrated DB and the C2C migration) run side by side.
 """
 
+import json
 import os
 import pathlib
+import queue
+import shlex
 import shutil
 import subprocess
+import threading
 import zipfile
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from dataclasses import dataclass
 from datetime import datetime
 from urllib.request import urlretrieve
 
 import click
 import psycopg2
+from psycopg2 import sql
 
-from ..utils.click import global_command_decorators
-from ..utils.path import build_path, root_path
+from ..utils.click import global_command_decorators, pg_jobs_option
+from ..utils.db_template import get_dump_hash
+from ..utils.docker_compose import is_parallel_restorable
+from ..utils.path import atomic_output, build_path, root_path
 from ..utils.proj import get_current_version
 
 ODOO_UPGRADE_SCRIPT = "https://upgrade.odoo.com/upgrade"
 
+#: Number of independent steps run side by side
+MAX_PARALLEL_STEPS = 2
+
+#: Session settings of the restore of the Odoo S.A. migrated plain SQL dump:
+#: the restore is started over on failure, no need to wait for durable commits
+PSQL_RESTORE_OPTIONS = "-c synchronous_commit=off -c maintenance_work_mem=1GB"
+
+#: SQL dump of the database in the archive returned by the Odoo upgrade script
+UPGRADED_DUMP_SQL = "dump.sql"
+
+#: Size of the chunks the SQL dump is streamed to psql by
+PIPE_CHUNK_SIZE = 1024 * 1024
+
+#: PostgreSQL versions (as in ``server_version``) from which a database can
+#: be dropped despite open connections, and cloned by copying its files
+#: rather than through the WAL, which is much faster for large templates
+PG_DROP_FORCE_VERSION = 130000
+PG_FILE_COPY_VERSION = 150000
+
+#: Stages of the C2C migration, each one run on the result of the previous one
+C2C_STAGES = ("core", "external", "local", "cleanup")
+
+
+#: The step run by the current thread
+_current_step = threading.local()
+
+#: Locks of the databases cloned or dumped by the running steps: a database
+#: can't be cloned while connections to it are open, e.g: to dump it
+_db_locks: dict[str, threading.Lock] = {}
+
+#: Lock of the connection to the ``postgres`` database, shared by the steps
+_maintenance_lock = threading.Lock()
+
 
 def dt():
     return datetime.now().strftime("%F %T")
 
 
+@dataclass
+class Step:
+    """A migration step, and what it depends on"""
+
+    name: str
+    #: Runs the step. It may return values to keep in the state file, that
+    #: are available in ``ctx.obj`` for the next steps, even when it's skipped.
+    run: Callable[[], dict | None]
+    #: Steps whose outputs are used by this step: re-running them invalidates it
+    requires: tuple[str, ...] = ()
+    #: Steps to wait for, without using their outputs. The wait is over as soon
+    #: as they release their inputs (see `_release_inputs`), or are done.
+    after: tuple[str, ...] = ()
+    #: Returns the parameters and the checksums of the input files of the step
+    inputs: Callable[[], dict] = dict
+    #: Returns the outputs of the step, as ``("db", name)`` or ``("file", path)``
+    outputs: Callable[[], list[tuple[str, str]]] = list
+
+
+class MigrationState:
+    """Progress of the migration, persisted in a JSON file of the store path"""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            self.steps = json.loads(path.read_text())["steps"]
+        except (FileNotFoundError, ValueError, KeyError):
+            self.steps = {}
+
+    def get(self, name: str) -> dict:
+        return self.steps.get(name, {})
+
+    def update(self, name: str, **values):
+        with self._lock:
+            self.steps.setdefault(name, {}).update(values)
+            with atomic_output(self.path) as tmp_path:
+                tmp_path.write_text(json.dumps({"steps": self.steps}, indent=2))
+
+
 @click.command()
 @click.argument(
     "prod_dump_path",
@@ -65,6 +156,15 @@ def dt():
         "If not set, the project root folder will be used."
     ),
 )
+@click.option(
+    "--restart-from",
+    "restart_from",
+    multiple=True,
+    help=(
+        "Run this step again, as well as the steps depending on it, "
+        "even if they are already done. Can be repeated."
+    ),
+)
 @click.option(
     "--restart",
     is_flag=True,
@@ -95,6 +195,17 @@ def dt():
     is_flag=True,
     help="Do not generate database snapshots after each migration step.",
 )
+@click.option(
+    "--dump-format",
+    type=click.Choice(["c", "d"]),
+    default="c",
+    show_default=True,
+    help=(
+        "Format of the dumps of the migrated databases: c (custom, a single .pg "
+        "file) or d (directory, dumped with parallel jobs)."
+    ),
+)
+@pg_jobs_option
 @global_command_decorators
 @click.pass_context
 def cli(
@@ -102,12 +213,15 @@ def cli(
     prod_dump_path: str,
     contract_number: str,
     store_path: str,
+    restart_from: tuple[str, ...],
     restart: bool,
     restart_c2c: bool,
     restart_c2c_external: bool,
     restart_c2c_local: bool,
     restart_c2c_cleanup: bool,
     no_db_snapshot: bool,
+    dump_format: str,
+    jobs: int | None,
 ):
     """Run a full database migration (Odoo S.A. + C2C).
 
@@ -119,34 +233,193 @@ def cli(
     _check_migration_project()
     _prepare_parameters()
     _ensure_db_container_is_up()
-    # Run migration steps
-    steps = [
-        pre_migrate_restore_prod,
-        pre_migrate_fix_prod_data,
-        pre_migrate_dump_prod,
-        migrate_odoo,
-        restore_odoo_migrated,
-        dump_odoo_migrated,
-        migrate_c2c_core,
-        migrate_c2c_external,
-        migrate_c2c_local,
-        migrate_c2c_cleanup,
-        dump_c2c_migrated,
-        migration_done,
-    ]
-    for i, step in enumerate(steps, start=1):
-        title = f"{i:>2} - {step.__name__}..."
-        print(f"{dt()}: {title:<40}", end="", flush=True)
-        start = datetime.now()
-        is_done = step()
-        # print elapsed time, e.g. '+00:10:40' if step has been processed
-        if is_done:
-            end = datetime.now()
-            elapsed = end - start
-            elapsed_str = " +" + str(elapsed).split(".")[0]
-            print(elapsed_str)
+    steps = _get_steps()
+    step_names = [step.name for step in steps]
+    restart_steps = set(restart_from)
+    if unknown_steps := restart_steps - set(step_names):
+        raise click.BadParameter(
+            f"unknown steps {', '.join(sorted(unknown_steps))}, "
+            f"expected one of {', '.join(step_names)}",
+            param_hint="--restart-from",
+        )
+    # The restore of the production dump is never restarted: the whole
+    # migration restarts from the step after it
+    if restart:
+        restart_steps.add(step_names[1])
+    for stage, flag in zip(
+        C2C_STAGES,
+        (restart_c2c, restart_c2c_external, restart_c2c_local, restart_c2c_cleanup),
+        strict=True,
+    ):
+        if flag:
+            restart_steps.add(f"migrate_c2c_{stage}")
+    state = MigrationState(
+        ctx.obj["store_path"].joinpath(f"{ctx.obj['db_name']}.migration-state.json")
+    )
+    try:
+        _run_steps(steps, state, restart_steps)
+    finally:
+        _print_report(steps, state)
+    migration_done()
+
+
+def _run_steps(steps: list[Step], state: MigrationState, restart_steps: set[str]):
+    """Run the steps in the order of their dependencies
+
+    The steps whose dependencies are done (or released, for the ``after``
+    ones) are started right away, up to `MAX_PARALLEL_STEPS` at a time. If a
+    step fails, the running ones are waited for, and no other step is started.
+    """
+    ctx = click.get_current_context()
+    numbers = {step.name: i for i, step in enumerate(steps, start=1)}
+    pending = list(steps)
+    done: set[str] = set()
+    released: set[str] = set()
+    # Events sent by the running steps: (event, step name, error)
+    events: queue.Queue[tuple[str, str, BaseException | None]] = queue.Queue()
+
+    def run_step(step):
+        _current_step.release = lambda: events.put(("released", step.name, None))
+        try:
+            # click contexts are bound to the thread they're pushed in
+            with ctx.scope(cleanup=False):
+                _run_step(step, numbers[step.name], state, step.name in restart_steps)
+        except BaseException as error:
+            events.put(("failed", step.name, error))
         else:
-            print()
+            events.put(("done", step.name, None))
+        finally:
+            _current_step.release = None
+
+    errors = []
+    running = 0
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_STEPS) as executor:
+        while True:
+            for step in list(pending):
+                if done.issuperset(step.requires) and released.issuperset(step.after):
+                    pending.remove(step)
+                    executor.submit(run_step, step)
+                    running += 1
+            if not running:
+                break
+            event, name, error = events.get()
+            released.add(name)
+            if event == "released":
+                continue
+            running -= 1
+            if error:
+                # Let the running steps end, without starting new ones
+                errors.append(error)
+                pending.clear()
+            else:
+                done.add(name)
+    if errors:
+        raise errors[0]
+    if pending:
+        raise RuntimeError(
+            f"Unable to run steps {', '.join(step.name for step in pending)}: "
+            "their dependencies can't be satisfied"
+        )
+
+
+def _release_inputs():
+    """Let the steps waiting for the current one start, before it's done
+
+    E.g: once the databases it reads from are cloned.
+    """
+    if release := getattr(_current_step, "release", None):
+        release()
+
+
+@click.pass_context
+def _run_step(ctx, step: Step, number: int, state: MigrationState, restart: bool):
+    """Run a step, unless it's done with the same inputs and outputs"""
+    title = f"{number:>2} - {step.name}..."
+    record = state.get(step.name)
+    inputs = step.inputs()
+    # Tie the step to the run of the steps it uses the outputs of
+    for name in step.requires:
+        inputs[f"step:{name}"] = state.get(name).get("finished")
+    if (
+        not restart
+        and record.get("status") == "done"
+        and record.get("inputs") == inputs
+        and _check_outputs(step, record)
+    ):
+        ctx.obj.update(record.get("values", {}))
+        print(f"{dt()}: {title:<40}ℹ️  (skipped: done on {record['finished']})")
+        return
+    print(f"{dt()}: {title:<40}⏳", flush=True)
+    start = datetime.now()
+    state.update(step.name, status="running", started=start.isoformat())
+    try:
+        values = step.run() or {}
+    except BaseException:
+        print(f"{dt()}: {title:<40}💥")
+        state.update(step.name, status="failed")
+        raise
+    end = datetime.now()
+    ctx.obj.update(values)
+    state.update(
+        step.name,
+        status="done",
+        finished=end.isoformat(),
+        duration=(end - start).total_seconds(),
+        inputs=inputs,
+        outputs=_get_outputs_checksums(step),
+        values=values,
+    )
+    # print elapsed time, e.g. '+00:10:40'
+    elapsed_str = " +" + str(end - start).split(".")[0]
+    print(f"{dt()}: {title:<40}✅{elapsed_str}")
+
+
+def _get_outputs_checksums(step: Step) -> dict[str, str | None]:
+    checksums = {}
+    for kind, value in step.outputs():
+        if kind == "file":
+            checksums[f"file:{value}"] = get_dump_hash(value)
+        else:
+            checksums[f"{kind}:{value}"] = None
+    return checksums
+
+
+def _check_outputs(step: Step, record: dict) -> bool:
+    """Tell whether the outputs of a step are the ones it produced"""
+    checksums = record.get("outputs", {})
+    outputs = step.outputs()
+    if any(f"{kind}:{value}" not in checksums for kind, value in outputs):
+        return False
+    db_names = {value for kind, value in outputs if kind == "db"}
+    if db_names and not _existing_dbs(db_names) >= db_names:
+        return False
+    for kind, value in outputs:
+        if kind == "file" and (
+            not pathlib.Path(value).exists()
+            or get_dump_hash(value) != checksums[f"file:{value}"]
+        ):
+            return False
+    return True
+
+
+def _print_report(steps: list[Step], state: MigrationState):
+    print("\nDuration of the last run of each step:")
+    total = 0.0
+    for step in steps:
+        record = state.get(step.name)
+        duration = record.get("duration")
+        if record.get("status") != "done" or duration is None:
+            print(f"\t{step.name:<30} {record.get('status', 'pending')}")
+            continue
+        total += duration
+        print(f"\t{step.name:<30} {_format_duration(duration)}")
+    print(f"\t{'total':<30} {_format_duration(total)}")
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
 
 
 @click.pass_context
@@ -178,6 +451,9 @@ def _prepare_parameters(ctx):
     ctx.obj["db_name"] = prod_dump_path.stem
     ctx.obj["db_prod"] = ctx.obj["db_name"] + "_prod"
     ctx.obj["db_prod_fixed"] = ctx.obj["db_name"] + "_prod_fixed"
+    # Use the production DB as is if there is no pre-migration script
+    if not build_path(ctx.obj["pre_migration_sql_path"]).exists():
+        ctx.obj["db_prod_fixed"] = ctx.obj["db_prod"]
     ctx.obj["db_odoo_migrated"] = ctx.obj["db_name"] + "_odoo_migrated"
     ctx.obj["db_c2c_core"] = ctx.obj["db_name"] + "_core"
     ctx.obj["db_c2c_external"] = ctx.obj["db_name"] + "_external"
@@ -185,124 +461,172 @@ def _prepare_parameters(ctx):
     ctx.obj["db_c2c_cleanup"] = ctx.obj["db_name"] + "_cleanup"
     ctx.obj["db_c2c_migrated"] = ctx.obj["db_name"] + "_c2c_migrated"
     ctx.obj["contract_number"] = ctx.params["contract_number"]
+    ctx.obj["jobs"] = ctx.params["jobs"] or os.cpu_count() or 1
+
+
+@click.pass_context
+def _get_steps(ctx) -> list[Step]:
+    """Return the steps of the migration, in the order they're listed"""
+    obj = ctx.obj
+    store_path = obj["store_path"]
+    no_db_snapshot = ctx.params["no_db_snapshot"]
+    pre_migration_sql = build_path(obj["pre_migration_sql_path"])
+    steps = [
+        Step(
+            "pre_migrate_restore_prod",
+            pre_migrate_restore_prod,
+            inputs=lambda: {"dump": get_dump_hash(obj["input_db_path"])},
+            outputs=lambda: [("db", obj["db_prod"])],
+        ),
+    ]
+    if pre_migration_sql.exists():
+        steps += [
+            Step(
+                "pre_migrate_fix_prod_data",
+                pre_migrate_fix_prod_data,
+                requires=("pre_migrate_restore_prod",),
+                inputs=lambda: {"script": get_dump_hash(pre_migration_sql)},
+                outputs=lambda: [("db", obj["db_prod_fixed"])],
+            ),
+            Step(
+                "pre_migrate_dump_prod",
+                pre_migrate_dump_prod,
+                requires=("pre_migrate_fix_prod_data",),
+                outputs=lambda: [("file", str(_get_db_prod_fixed_dump_path()))],
+            ),
+        ]
+    else:
+        steps.append(
+            Step(
+                "pre_migrate_dump_prod",
+                pre_migrate_dump_prod,
+                inputs=lambda: {"dump": get_dump_hash(obj["input_db_path"])},
+                outputs=lambda: [("file", str(_get_db_prod_fixed_dump_path()))],
+            )
+        )
+    steps += [
+        Step(
+            "migrate_odoo",
+            migrate_odoo,
+            # The contract number is read from the restored production DB
+            requires=("pre_migrate_restore_prod", "pre_migrate_dump_prod"),
+            inputs=lambda: {
+                "target_version": obj["target_version"],
+                "contract_number": _get_contract_number(),
+            },
+            outputs=lambda: [("file", str(store_path.joinpath("upgraded.zip")))],
+        ),
+        Step(
+            "restore_odoo_migrated",
+            restore_odoo_migrated,
+            requires=("migrate_odoo",),
+            outputs=lambda: [("db", obj["db_odoo_migrated"])],
+        ),
+        # The Odoo S.A. migrated DB can't be cloned while it's being dumped:
+        # the dump waits for the C2C core stage to clone it, then runs along
+        # the C2C migration
+        Step(
+            "dump_odoo_migrated",
+            dump_odoo_migrated,
+            requires=("restore_odoo_migrated",),
+            after=("migrate_c2c_core",),
+            outputs=lambda: [("file", str(_get_db_odoo_migrated_dump_path()))],
+        ),
+    ]
+    previous = "restore_odoo_migrated"
+    for stage in C2C_STAGES:
+        name = f"migrate_c2c_{stage}"
+        snapshot = obj["db_name"] if no_db_snapshot else obj[f"db_c2c_{stage}"]
+        steps.append(
+            Step(
+                name,
+                lambda stage=stage: migrate_c2c(stage),
+                requires=(previous,),
+                inputs=lambda: {"no_db_snapshot": no_db_snapshot},
+                outputs=lambda snapshot=snapshot: [("db", snapshot)],
+            )
+        )
+        previous = name
+    steps.append(
+        Step(
+            "dump_c2c_migrated",
+            dump_c2c_migrated,
+            requires=(previous,),
+            outputs=lambda: [("file", str(_get_db_c2c_migrated_dump_path()))],
+        )
+    )
+    return steps
 
 
 @click.pass_context
 def pre_migrate_restore_prod(ctx):
-    is_done = False
     db_path = ctx.obj["input_db_path"]
     db_name = ctx.obj["db_prod"]
-    if not _db_exists(db_name):
-        _dropdb(db_name)
-        _createdb(db_name)
-        try:
-            _run_docker_compose_cmd(
-                f"run -T --rm odoo pg_restore -x -O -d {db_name} < {db_path}"
-            )
-        except subprocess.CalledProcessError:
-            print("💥")
-            raise
-        print("✅", end="")
-        is_done = True
-    else:
-        print("ℹ️  (skipped: prod database already restored)", end="")
-    # Retrieve Odoo Contract Number from prod database
-    if not ctx.obj["contract_number"]:
-        res = _execute_db_request(
-            db_name,
-            "SELECT value FROM ir_config_parameter WHERE key='database.enterprise_code';",
+    _dropdb(db_name)
+    _createdb(db_name)
+    # Mount the dump for pg_restore to read it with parallel jobs
+    container_db_path = pathlib.Path("/migrate-db-input", db_path.name)
+    jobs_opts = f"-j {ctx.obj['jobs']} " if is_parallel_restorable(db_path) else ""
+    _run_docker_compose_cmd(
+        f"run -v {db_path.parent}:{container_db_path.parent} -T --rm odoo "
+        f"pg_restore -x -O {jobs_opts}-d {db_name} {container_db_path}"
+    )
+    # Retrieve Odoo Contract Number from prod database, kept in the state file
+    # for the next runs
+    res = _execute_db_request(
+        db_name,
+        "SELECT value FROM ir_config_parameter WHERE key='database.enterprise_code';",
+    )
+    db_contract_number = res[0][0] if res else None
+    if not ctx.obj["contract_number"] and not db_contract_number:
+        raise SystemExit(
+            "\nUnable to retrieve the Odoo Contract Number from prod database. "
+            "Please provide it with --contract-number / -c parameter."
         )
-        if res:
-            contract_number = res[0][0]
-            ctx.obj["contract_number"] = contract_number
-        if not ctx.obj["contract_number"]:
-            raise SystemExit(
-                "\nUnable to retrieve the Odoo Contract Number from prod database. "
-                "Please provide it with --contract-number / -c parameter."
-            )
-    return is_done
+    return {"db_contract_number": db_contract_number}
 
 
 @click.pass_context
 def pre_migrate_fix_prod_data(ctx):
-    is_done = False
     db_prod = ctx.obj["db_prod"]
     db_prod_fixed = ctx.obj["db_prod_fixed"]
-    script_path = build_path(ctx.obj["pre_migration_sql_path"])
     container_script_path = "/" + ctx.obj["pre_migration_sql_path"]
-    if script_path.exists():
-        if not _db_exists(db_prod_fixed) or ctx.params["restart"]:
-            # Fixed prod db doesn't exist or restart enabled => create it
-            _dropdb(db_prod_fixed)
-            _createdb(db_prod_fixed, db_template=db_prod)
-            try:
-                _run_docker_compose_cmd(
-                    f"run -T --rm odoo psql -d {db_prod_fixed} "
-                    f"-f {container_script_path}"
-                )
-            except subprocess.CalledProcessError:
-                print("💥")
-                raise
-            print("✅", end="")
-            is_done = True
-        else:
-            print("ℹ️  (skipped: fixed production database already exists)", end="")
-        return is_done
-    print("ℹ️  (skipped: no pre-migration.sql script to run)", end="")
-    # Force the fixed DB name to current one if there is no pre-migration script
-    ctx.obj["db_prod_fixed"] = ctx.obj["db_prod"]
-    return is_done
+    _dropdb(db_prod_fixed)
+    _createdb(db_prod_fixed, db_template=db_prod)
+    _run_docker_compose_cmd(
+        f"run -T --rm odoo psql -d {db_prod_fixed} -f {container_script_path}"
+    )
 
 
 @click.pass_context
 def pre_migrate_dump_prod(ctx):
-    is_done = False
     db_name = ctx.obj["db_prod_fixed"]
     dump_path = _get_db_prod_fixed_dump_path()
-    if ctx.params["restart"] and dump_path.exists():
-        dump_path.unlink()
-    if dump_path.exists():
-        print("ℹ️  (skipped: production database dump already exists)", end="")
-        return is_done
     script_path = build_path(ctx.obj["pre_migration_sql_path"])
     if not script_path.exists():
         # No pre-migration.sql script means we don't need to dump the fixed
         # production database (could be long depending on the DB size).
         # A simple copy of the .pg file to .dump is enough to satisfy
-        # Odoo S.A. upgrade script.
-        shutil.copy(ctx.obj["input_db_path"], dump_path)
-        print("✅", end="")
-        is_done = True
-        return is_done
-    container_dump_path = _get_db_prod_fixed_dump_path(in_container=True)
-    mount_opts = f"-v {ctx.obj['store_path']}:/{ctx.obj['container_store_path']}"
-    try:
-        _run_docker_compose_cmd(
-            f"run {mount_opts} --rm odoo pg_dump -b -Fc -d {db_name} "
-            f"-f {container_dump_path}"
-        )
-    except subprocess.CalledProcessError:
-        print("💥")
-        raise
-    print("✅", end="")
-    return True
+        # Odoo S.A. upgrade script: hard link it when possible.
+        with atomic_output(dump_path) as tmp_dump_path:
+            try:
+                os.link(ctx.obj["input_db_path"], tmp_dump_path)
+            except OSError:
+                shutil.copy(ctx.obj["input_db_path"], tmp_dump_path)
+        return
+    _dump_db(db_name, dump_path)
 
 
 @click.pass_context
 def migrate_odoo(ctx):
     upgraded_zip_path = ctx.obj["store_path"].joinpath("upgraded.zip")
-    if ctx.params["restart"] and upgraded_zip_path.exists():
-        upgraded_zip_path.unlink()
-    if upgraded_zip_path.exists():
-        print("ℹ️  (skipped: upgraded.zip file already exists)", end="")
-        return False
+    upgraded_zip_path.unlink(missing_ok=True)
     prod_dump_path = _get_db_prod_fixed_dump_path()
     script_path = ctx.obj["store_path"].joinpath("odoo_upgrade.py")
     urlretrieve(ODOO_UPGRADE_SCRIPT, script_path)
-    os.chdir(ctx.obj["store_path"])
     cmd = (
         f"TMPDIR=$(mktemp -d) /usr/bin/env python3 {script_path} production "
-        f"-c {ctx.obj['contract_number']} "
+        f"-c {_get_contract_number()} "
         f"--dump {prod_dump_path} "
         f"-t {ctx.obj['target_version']} "
         f"--no-restore "
@@ -310,7 +634,9 @@ def migrate_odoo(ctx):
     env_file_path = ctx.obj["odoo_upgrade_env_path"]
     if env_file_path.exists():
         cmd += f"--env-file {env_file_path}"
-    ret = subprocess.run(cmd, shell=True, capture_output=True)
+    ret = subprocess.run(
+        cmd, shell=True, capture_output=True, cwd=ctx.obj["store_path"]
+    )
     if ret.returncode:
         print("💥 FAILED 💥")
         log_path = ctx.obj["store_path"].joinpath("upgrade.log")
@@ -320,46 +646,50 @@ def migrate_odoo(ctx):
         print("💥 FAILED 💥")
         print("== Logs from Odoo upgrade ==")
         raise SystemExit(ret.stderr.decode())
-    print("✅", end="")
-    return True
+
+
+@click.pass_context
+def _get_contract_number(ctx):
+    """Return the contract number given as option, or read from the prod DB"""
+    return ctx.obj["contract_number"] or ctx.obj.get("db_contract_number")
 
 
 @click.pass_context
 def restore_odoo_migrated(ctx):
-    # Check if Odoo S.A. database is already restored
     db_name = ctx.obj["db_odoo_migrated"]
-    if _db_exists(db_name) and not ctx.params["restart"]:
-        print("ℹ️  (skipped: Odoo S.A. migrated database already restored)", end="")
-        return False
-    # Unzip upgraded.zip archive
     upgraded_zip_path = ctx.obj["store_path"].joinpath("upgraded.zip")
-    upgraded_dir_path = ctx.obj["store_path"].joinpath("upgraded")
     assert upgraded_zip_path.exists()
-    if not upgraded_dir_path.exists():
-        with zipfile.ZipFile(upgraded_zip_path) as upgraded:
-            upgraded.extractall(path=upgraded_dir_path)
     # Restore Odoo S.A. migrated database
-    container_dump_sql_path = ctx.obj["container_store_path"].joinpath(
-        "upgraded", "dump.sql"
-    )
     _dropdb(db_name)
     _createdb(db_name)
-    mount_opts = f"-v {ctx.obj['store_path']}:/{ctx.obj['container_store_path']}"
-    try:
-        _run_docker_compose_cmd(
-            f"run {mount_opts} -T --rm odoo psql -d {db_name} "
-            f"-f {container_dump_sql_path}",
+    env_opts = "-e " + shlex.quote(f"PGOPTIONS={PSQL_RESTORE_OPTIONS}")
+    with zipfile.ZipFile(upgraded_zip_path) as upgraded:
+        if UPGRADED_DUMP_SQL in upgraded.namelist():
+            # Stream the SQL dump to psql, rather than writing tens of
+            # gigabytes to the disk to read them once.
             # Errors regarding owner or extensions for instance could exists
             # in raw SQL file, they have to be ignored.
-            raise_on_error=False,
-        )
-    except subprocess.CalledProcessError:
-        print("💥")
-        raise
-    assert upgraded_dir_path.exists()
+            with upgraded.open(UPGRADED_DUMP_SQL) as dump_sql:
+                _pipe_to_docker_compose_cmd(
+                    f"run {env_opts} -T --rm odoo psql -d {db_name}", dump_sql
+                )
+            return
+        # Unzip upgraded.zip archive, whose dump isn't where it's expected
+        upgraded_dir_path = ctx.obj["store_path"].joinpath("upgraded")
+        if not upgraded_dir_path.exists():
+            upgraded.extractall(path=upgraded_dir_path)
+    dump_sql_path = next(upgraded_dir_path.rglob(UPGRADED_DUMP_SQL), None)
+    assert dump_sql_path, f"No {UPGRADED_DUMP_SQL} in {upgraded_zip_path}"
+    container_dump_sql_path = ctx.obj["container_store_path"].joinpath(
+        dump_sql_path.relative_to(ctx.obj["store_path"])
+    )
+    mount_opts = f"-v {ctx.obj['store_path']}:/{ctx.obj['container_store_path']}"
+    _run_docker_compose_cmd(
+        f"run {mount_opts} {env_opts} -T --rm odoo psql -d {db_name} "
+        f"-f {container_dump_sql_path}",
+        raise_on_error=False,
+    )
     shutil.rmtree(upgraded_dir_path)
-    print("✅", end="")
-    return True
 
 
 @click.pass_context
@@ -367,170 +697,57 @@ def dump_odoo_migrated(ctx):
     # Dump Odoo S.A. migrated database in a logical/custom Pg format
     # (lighter than raw dump.sql to share it on Celebrimbor afterwards)
     odoo_migrated_path = _get_db_odoo_migrated_dump_path()
-    if odoo_migrated_path.exists() and not ctx.params["restart"]:
-        print("ℹ️  (skipped: Odoo S.A. migrated dump already exists)", end="")
-        return False
     db_name = ctx.obj["db_odoo_migrated"]
-    container_odoo_migrated_path = _get_db_odoo_migrated_dump_path(in_container=True)
-    mount_opts = f"-v {ctx.obj['store_path']}:/{ctx.obj['container_store_path']}"
-    try:
-        _run_docker_compose_cmd(
-            f"run {mount_opts} --rm odoo pg_dump -b -Fc -d {db_name} "
-            f"-f {container_odoo_migrated_path}"
-        )
-    except subprocess.CalledProcessError:
-        print("💥")
-        raise
-    print("✅", end="")
-    return True
-
-
-@click.pass_context
-def migrate_c2c_core(ctx):
-    db_core = ctx.obj["db_c2c_core"]
-    if (
-        _db_exists(db_core)
-        and not ctx.params["restart_c2c"]
-        and not ctx.params["restart"]
-    ):
-        print("ℹ️  (skipped: C2C core database already migrated)", end="")
-        return False
-    # Force next C2C migration steps if '--force-odoo' is set
-    if ctx.params["restart"]:
-        ctx.params["restart_c2c"] = True
-    # Create working database from Odoo S.A. migrated one (template)
-    db_odoo_migrated = ctx.obj["db_odoo_migrated"]
-    db_name = ctx.obj["db_name"]
-    log_file = ctx.obj["store_path"].joinpath(f"{db_name}_c2c_core.log")
-    if not _db_exists(db_name) or ctx.params["restart_c2c"]:
-        _dropdb(db_name)
-        _createdb(db_name, db_template=db_odoo_migrated)
-    try:
-        make_db_snapshot = 0 if ctx.params["no_db_snapshot"] else 1
-        _run_docker_compose_cmd(
-            f"run --rm -e DB_NAME={db_name} -e MAKE_DB_SNAPSHOT={make_db_snapshot} "
-            f"migrate-db migrate-db-core > {log_file}"
-        )
-    except subprocess.CalledProcessError:
-        print("💥 C2C core migration failed.")
-        raise SystemExit(f"=> Check logs located at {log_file}")  # noqa: B904
-    print("✅", end="")
-    return True
+    _dump_db(db_name, odoo_migrated_path, format=ctx.params["dump_format"])
 
 
 @click.pass_context
-def migrate_c2c_external(ctx):
-    # Force next C2C migration steps if '--force-c2c-external' is set
-    if ctx.params["restart_c2c_external"]:
-        ctx.params["restart_c2c"] = True
-    db_external = ctx.obj["db_c2c_external"]
-    if _db_exists(db_external) and not ctx.params["restart_c2c"]:
-        print("ℹ️  (skipped: C2C external database already migrated)", end="")
-        return False
-    db_name = ctx.obj["db_name"]
-    log_file = ctx.obj["store_path"].joinpath(f"{db_name}_c2c_external.log")
-    if not _db_exists(db_name) or ctx.params["restart_c2c_external"]:
-        db_previous = ctx.obj["db_c2c_core"]
-        _dropdb(db_name)
-        _createdb(db_name, db_template=db_previous)
-    try:
-        make_db_snapshot = 0 if ctx.params["no_db_snapshot"] else 1
-        _run_docker_compose_cmd(
-            f"run --rm -e DB_NAME={db_name} -e MAKE_DB_SNAPSHOT={make_db_snapshot} "
-            f"migrate-db migrate-db-external > {log_file}"
-        )
-    except subprocess.CalledProcessError:
-        print("💥 C2C external migration failed.")
-        raise SystemExit(f"=> Check logs located at {log_file}")  # noqa: B904
-    print("✅", end="")
-    return True
-
-
-@click.pass_context
-def migrate_c2c_local(ctx):
-    # Force next C2C migration steps if '--force-c2c-local' is set
-    if ctx.params["restart_c2c_local"]:
-        ctx.params["restart_c2c"] = True
-    db_local = ctx.obj["db_c2c_local"]
-    if _db_exists(db_local) and not ctx.params["restart_c2c"]:
-        print("ℹ️  (skipped: C2C local database already migrated)", end="")
-        return False
-    db_name = ctx.obj["db_name"]
-    log_file = ctx.obj["store_path"].joinpath(f"{db_name}_c2c_local.log")
-    if not _db_exists(db_name) or ctx.params["restart_c2c_local"]:
-        db_previous = ctx.obj["db_c2c_external"]
-        _dropdb(db_name)
-        _createdb(db_name, db_template=db_previous)
-    try:
-        make_db_snapshot = 0 if ctx.params["no_db_snapshot"] else 1
-        _run_docker_compose_cmd(
-            f"run --rm -e DB_NAME={db_name} -e MAKE_DB_SNAPSHOT={make_db_snapshot} "
-            f"migrate-db migrate-db-local > {log_file}"
-        )
-    except subprocess.CalledProcessError:
-        print("💥 C2C local migration failed.")
-        raise SystemExit(f"=> Check logs located at {log_file}")  # noqa: B904
-    print("✅", end="")
-    return True
-
+def migrate_c2c(ctx, stage):
+    """Run a stage of the C2C migration.
 
-@click.pass_context
-def migrate_c2c_cleanup(ctx):
-    # Force next C2C migration steps if '--force-c2c-cleanup' is set
-    if ctx.params["restart_c2c_cleanup"]:
-        ctx.params["restart_c2c"] = True
-    db_cleanup = ctx.obj["db_c2c_cleanup"]
-    if _db_exists(db_cleanup) and not ctx.params["restart_c2c"]:
-        print("ℹ️  (skipped: C2C cleanup database already migrated)", end="")
-        return False
+    The stage starts over from a copy of the result of the previous stage
+    (i.e: its snapshot, or the Odoo S.A. migrated DB), so that it can be run
+    again after a failure. Without snapshots, the stages after the core one
+    run on the database as is.
+    """
     db_name = ctx.obj["db_name"]
-    log_file = ctx.obj["store_path"].joinpath(f"{db_name}_c2c_cleanup.log")
-    if not _db_exists(db_name) or ctx.params["restart_c2c_cleanup"]:
-        db_previous = ctx.obj["db_c2c_local"]
+    log_file = ctx.obj["store_path"].joinpath(f"{db_name}_c2c_{stage}.log")
+    index = C2C_STAGES.index(stage)
+    db_previous = None
+    if index == 0:
+        db_previous = ctx.obj["db_odoo_migrated"]
+    elif not ctx.params["no_db_snapshot"]:
+        db_previous = ctx.obj[f"db_c2c_{C2C_STAGES[index - 1]}"]
+    if db_previous:
         _dropdb(db_name)
         _createdb(db_name, db_template=db_previous)
+    # The previous database can be dumped from now on
+    _release_inputs()
     try:
         make_db_snapshot = 0 if ctx.params["no_db_snapshot"] else 1
         _run_docker_compose_cmd(
             f"run --rm -e DB_NAME={db_name} -e MAKE_DB_SNAPSHOT={make_db_snapshot} "
-            f"migrate-db migrate-db-cleanup > {log_file}"
+            f"migrate-db migrate-db-{stage} > {log_file}"
         )
     except subprocess.CalledProcessError:
-        print("💥 C2C cleanup migration failed.")
+        print(f"💥 C2C {stage} migration failed.")
         raise SystemExit(f"=> Check logs located at {log_file}")  # noqa: B904
-    print("✅", end="")
-    return True
 
 
 @click.pass_context
 def dump_c2c_migrated(ctx):
     c2c_migrated_path = _get_db_c2c_migrated_dump_path()
-    if c2c_migrated_path.exists() and not ctx.params["restart_c2c"]:
-        print("ℹ️  (skipped: C2C migrated dump already exists)", end="")
-        return False
     db_cleanup = (
         ctx.obj["db_name"]
         if ctx.params["no_db_snapshot"]
         else ctx.obj["db_c2c_cleanup"]
     )
     assert _db_exists(db_cleanup)
-    container_c2c_migrated_path = _get_db_c2c_migrated_dump_path(in_container=True)
-    mount_opts = f"-v {ctx.obj['store_path']}:/{ctx.obj['container_store_path']}"
-    try:
-        _run_docker_compose_cmd(
-            f"run {mount_opts} --rm odoo pg_dump -b -Fc -d {db_cleanup} "
-            f"-f {container_c2c_migrated_path}"
-        )
-    except subprocess.CalledProcessError:
-        print("💥 Dump of C2C cleanup snapshot failed.")
-        raise
-    print("✅", end="")
-    return True
+    _dump_db(db_cleanup, c2c_migrated_path, format=ctx.params["dump_format"])
 
 
 @click.pass_context
 def migration_done(ctx):
-    print("✅")
     odoo_migrated_path = _get_db_odoo_migrated_dump_path()
     c2c_migrated_path = _get_db_c2c_migrated_dump_path()
     print("\nYou can now upload on the relevant Celebrimbor environment:")
@@ -551,32 +768,57 @@ def _run_docker_compose_cmd(ctx, cmd, raise_on_error=True, capture_output=True):
 
 
 @click.pass_context
-def _ensure_db_container_is_up(ctx):
-    return _run_docker_compose_cmd("up -d db")
+def _pipe_to_docker_compose_cmd(ctx, cmd, stream):
+    """Run a 'docker compose' command in project folder, fed with ``stream``.
+
+    Its output is discarded.
+    """
+    base_cmd = f"docker compose --project-directory {ctx.obj['project_path']}"
+    full_cmd = f"{base_cmd} {cmd}"
+    with subprocess.Popen(
+        full_cmd,
+        shell=True,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    ) as process:
+        assert process.stdin
+        shutil.copyfileobj(stream, process.stdin, PIPE_CHUNK_SIZE)
+    return process.returncode
 
 
 @click.pass_context
-def _dropdb(ctx, db_name):
-    cmd = f"run --rm odoo dropdb --if-exists {db_name}"
+def _ensure_db_container_is_up(ctx):
+    ret = _run_docker_compose_cmd("up -d db")
+    # The port is kept as long as the container runs: resolve it once
+    ctx.obj["db_port"] = _get_db_container_port()
+    return ret
+
+
+def _dropdb(db_name):
+    query = sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(db_name))
     try:
-        return _run_docker_compose_cmd(cmd)
-    except subprocess.CalledProcessError:
-        print(f"💥  Unable to drop DB {db_name}")
+        _execute_ddl(query, force_since=PG_DROP_FORCE_VERSION)
+    except psycopg2.Error as error:
+        print(f"💥  Unable to drop DB {db_name}: {error}".strip())
         raise SystemExit(f"=> Is there an open connection on {db_name}?") from None
 
 
-@click.pass_context
-def _createdb(ctx, db_name, db_template=None):
-    cmd = f"run --rm odoo createdb {db_name}"
+def _createdb(db_name, db_template=None):
+    query = sql.SQL("CREATE DATABASE {}").format(sql.Identifier(db_name))
     if db_template:
-        cmd += f" -T {db_template}"
+        query += sql.SQL(" TEMPLATE {}").format(sql.Identifier(db_template))
     try:
-        return _run_docker_compose_cmd(cmd)
-    except subprocess.CalledProcessError:
+        with _db_locks.setdefault(db_template or db_name, threading.Lock()):
+            _execute_ddl(
+                query,
+                file_copy_since=PG_FILE_COPY_VERSION if db_template else None,
+            )
+    except psycopg2.Error as error:
         msg = f"💥  Unable to create DB {db_name}"
         if db_template:
             msg += f" from {db_template}"
-        print(msg)
+        print(f"{msg}: {error}".strip())
         if db_template:
             raise SystemExit(
                 f"=> Is there an open connection on {db_template}?"
@@ -584,28 +826,71 @@ def _createdb(ctx, db_name, db_template=None):
         raise SystemExit() from None
 
 
+def _execute_ddl(query, force_since=None, file_copy_since=None):
+    """Run a database DDL on the connection to ``postgres``
+
+    The ``WITH (FORCE)`` and ``STRATEGY FILE_COPY`` options are added on the
+    PostgreSQL versions supporting them, as given by ``force_since`` and
+    ``file_copy_since``.
+    """
+    with _maintenance_lock:
+        db_connection = _get_maintenance_connection()
+        version = db_connection.server_version
+        if force_since and version >= force_since:
+            query += sql.SQL(" WITH (FORCE)")
+        if file_copy_since and version >= file_copy_since:
+            query += sql.SQL(" STRATEGY FILE_COPY")
+        with db_connection.cursor() as db_cursor:
+            db_cursor.execute(query)
+
+
 @click.pass_context
-def _get_db_prod_fixed_dump_path(ctx, in_container=False):
-    base_path = ctx.obj["store_path"]
-    if in_container:
-        base_path = ctx.obj["container_store_path"]
-    return base_path.joinpath(f"{ctx.obj['db_prod_fixed']}.dump")
+def _dump_db(ctx, db_name, dump_path, format="c"):
+    """Dump a database into the store path.
+
+    The dump only shows up at ``dump_path`` once complete, so that an
+    interrupted dump isn't mistaken for a done step on the next run.
+    Directory format (``d``) dumps are done with parallel jobs.
+    """
+    jobs_opts = f"-j {ctx.obj['jobs']} " if format == "d" else ""
+    mount_opts = f"-v {ctx.obj['store_path']}:/{ctx.obj['container_store_path']}"
+    with (
+        _db_locks.setdefault(db_name, threading.Lock()),
+        atomic_output(dump_path) as tmp_dump_path,
+    ):
+        container_dump_path = ctx.obj["container_store_path"] / tmp_dump_path.name
+        _run_docker_compose_cmd(
+            f"run {mount_opts} --rm odoo pg_dump -b -F{format} {jobs_opts}-d {db_name} "
+            f"-f {container_dump_path}"
+        )
+        # A directory can't replace the one of a previous run
+        if dump_path.is_dir():
+            shutil.rmtree(dump_path)
 
 
 @click.pass_context
-def _get_db_odoo_migrated_dump_path(ctx, in_container=False):
-    base_path = ctx.obj["store_path"]
-    if in_container:
-        base_path = ctx.obj["container_store_path"]
-    return base_path.joinpath(f"{ctx.obj['db_odoo_migrated']}.pg")
+def _get_db_prod_fixed_dump_path(ctx):
+    return ctx.obj["store_path"].joinpath(f"{ctx.obj['db_prod_fixed']}.dump")
 
 
 @click.pass_context
-def _get_db_c2c_migrated_dump_path(ctx, in_container=False):
-    base_path = ctx.obj["store_path"]
-    if in_container:
-        base_path = ctx.obj["container_store_path"]
-    return base_path.joinpath(f"{ctx.obj['db_c2c_migrated']}.pg")
+def _get_db_odoo_migrated_dump_path(ctx):
+    return ctx.obj["store_path"].joinpath(
+        ctx.obj["db_odoo_migrated"] + _get_dump_suffix()
+    )
+
+
+@click.pass_context
+def _get_db_c2c_migrated_dump_path(ctx):
+    return ctx.obj["store_path"].joinpath(
+        ctx.obj["db_c2c_migrated"] + _get_dump_suffix()
+    )
+
+
+@click.pass_context
+def _get_dump_suffix(ctx):
+    # Directory format dumps are directories, named after the database
+    return "" if ctx.params["dump_format"] == "d" else ".pg"
 
 
 @click.pass_context
@@ -616,24 +901,52 @@ def _get_db_container_port(ctx):
 
 
 @click.pass_context
-def _execute_db_request(ctx, db_name, sql):
+def _connect(ctx, db_name):
+    """Open a connection to a database of the DB container"""
+    return psycopg2.connect(
+        host="localhost",
+        dbname=db_name,
+        user="odoo",
+        password="odoo",
+        port=ctx.obj["db_port"],
+    )
+
+
+@click.pass_context
+def _execute_db_request(ctx, db_name, sql, params=None):
     """Return the execution of given SQL request."""
-    result = False
-    db_port = _get_db_container_port()
-    dsn = f"host=localhost dbname={db_name} user=odoo password=odoo port={db_port}"
-    with psycopg2.connect(dsn) as db_connection:
+    with closing(_connect(db_name)) as db_connection, db_connection:
         with db_connection.cursor() as db_cursor:
-            db_cursor.execute(sql)
-            result = db_cursor.fetchall()
-    return result
+            db_cursor.execute(sql, params)
+            return db_cursor.fetchall()
 
 
 @click.pass_context
-def _db_exists(ctx, db_name):
-    res = _execute_db_request(
-        "postgres", f"SELECT datname FROM pg_database WHERE datname='{db_name}';"
-    )
-    return bool(res)
+def _get_maintenance_connection(ctx):
+    """Return the connection to the ``postgres`` database, opened once
+
+    Hold `_maintenance_lock` to use it.
+    """
+    db_connection = ctx.obj.get("maintenance_connection")
+    if db_connection is None or db_connection.closed:
+        db_connection = ctx.obj["maintenance_connection"] = _connect("postgres")
+        db_connection.autocommit = True
+        ctx.call_on_close(db_connection.close)
+    return db_connection
+
+
+def _existing_dbs(db_names) -> set[str]:
+    """Return which of the given databases exist, in a single query"""
+    with _maintenance_lock, _get_maintenance_connection().cursor() as db_cursor:
+        db_cursor.execute(
+            "SELECT datname FROM pg_database WHERE datname = ANY(%s)",
+            (list(db_names),),
+        )
+        return {datname for (datname,) in db_cursor.fetchall()}
+
+
+def _db_exists(db_name):
+    return db_name in _existing_dbs([db_name])
 
 
 if __name__ == "__main__":
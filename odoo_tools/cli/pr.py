@@ -5,8 +5,8 @@ from pathlib import Path
 
 import click
 
-from ..utils import db, docker_compose, gh, git, ui
-from ..utils.click import global_command_decorators
+from ..utils import db, db_template, docker_compose, gh, git, ui
+from ..utils.click import global_command_decorators, pg_jobs_option
 from ..utils.os_exec import run
 from ..utils.path import cd, root_path
 
@@ -30,6 +30,13 @@ def cli():
     default=False,
     help="create a template database for faster restores in the future.",
 )
+@click.option(
+    "--template-pool",
+    is_flag=True,
+    default=False,
+    help="restore the database dump through the template pool, "
+    "to clone it on the next restores.",
+)
 @click.option(
     "-t",
     "--template-db",
@@ -54,15 +61,18 @@ def cli():
     default=False,
     help="keep using preexisting DBs",
 )
+@pg_jobs_option
 @click.argument("pr_number")
 def test(
     pr_number,
     database_dump=None,
     template_db=None,
     create_template=None,
+    template_pool=False,
     keep_db=False,
     port=8069,
     base_branch="master",
+    jobs=None,
 ):
     """Test a pull request
 
@@ -71,9 +81,12 @@ def test(
     :param str template_db: template DB name (within docker DB container)
     :param bool create_template: if True, a new template DB is created
         when restoring a DB dump
+    :param bool template_pool: if True, the DB dump is restored through the
+        template pool
     :param bool keep_db: if True, DBs are not handled by this script
     :param int port: network port on which Odoo will listen
     :param str base_branch: base branch on which the PR is based
+    :param int jobs: number of parallel jobs to restore the DB dump with
     """
     run(docker_compose.down())
     docker_yml_name = f"docker-compose.override-{pr_number}.yml"
@@ -84,11 +97,16 @@ def test(
     if not keep_db:
         template_db_name = create_template and _get_db_name(pr_number, True) or ""
         # Case 1: ``--database-dump`` is specified
-        if database_dump:
+        if database_dump and template_pool:
+            db_template.create_db_from_pool(
+                db_name=db_name, dump_path=database_dump, jobs=jobs
+            )
+        elif database_dump:
             db.create_db_from_db_dump(
                 db_name=db_name,
                 db_dump=database_dump,
                 template_db_name=template_db_name,
+                jobs=jobs,
             )
         # Case 2: ``--template-db`` is specified
         elif template_db:
@@ -98,6 +116,7 @@ def test(
             db.create_db_from_local_files(
                 db_name=db_name,
                 template_db_name=template_db_name,
+                jobs=jobs,
             )
     ui.echo("Starting container")
     ui.echo(
@@ -132,7 +151,7 @@ def clean(pr_number):
     dbname = f"odoodb-{pr_number}"
 
     run(docker_compose.down())
-    run(docker_compose.drop_db(dbname))
+    db.drop_database(dbname)
 
 
 def handle_git_repository(pr_number, branch):
@@ -3,6 +3,7 @@ from . import (
     click,
     config,
     db,
+    db_template,
     docker_compose,
     gh,
     git,
@@ -24,6 +25,7 @@ __all__ = [
     "click",
     "config",
     "db",
+    "db_template",
     "docker_compose",
     "gh",
     "git",
@@ -16,6 +16,7 @@ __all__ = [
     "global_command_decorators",
     "is_debug",
     "jobs_option",
+    "pg_jobs_option",
     "version_option",
     "with_minimum_version_check",
     "with_update_check",
@@ -102,6 +103,18 @@ jobs_option = click.option(
 )
 
 
+#: ``--jobs`` option for the commands running the PostgreSQL client tools
+#: (``pg_restore``, ``pg_dump``) with parallel jobs. Unset, the number of jobs
+#: is sized to the number of CPU cores.
+pg_jobs_option = click.option(
+    "--jobs",
+    "jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of parallel PostgreSQL jobs. Defaults to the number of CPU cores.",
+)
+
+
 def _enable_debug(ctx, param, value):
     """Turn debug mode on as soon as the flag is parsed.
 
@@ -3,38 +3,63 @@
 
 import atexit
 import getpass
-import tempfile
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+import time
 import zipfile
-from contextlib import contextmanager
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
 from datetime import datetime
+from functools import cache
 from os import PathLike
 from pathlib import Path
-from typing import Literal
+from typing import IO, Literal
 
 import psycopg2
+from psycopg2 import sql
 
 from . import docker_compose, os_exec, proj, ui
+from .click import DEFAULT_MAX_WORKERS
+from .misc import get_cache_path
+from .path import atomic_output, root_path
+
+logger = logging.getLogger(__name__)
+
+#: Location of the filestore files in the Odoo archives
+FILESTORE_PREFIX = "filestore/"
 
 
 def create_db_from_db_dump(
     db_name: str,
     db_dump: PathLike | str,
     template_db_name: str | None = None,
+    jobs: int | None = None,
+    check: bool = False,
 ):
     """Restores a DB dump, optionally creates a DB template
 
     :param str db_name: name of the DB to create
     :param str db_dump: filename of the DB dump to restore
     :param str template_db_name: if set, a new template DB of the given name is created
+    :param int jobs: number of parallel restore jobs, defaults to the CPU cores
+    :param bool check: if set, errors of the restore raise instead of being
+        ignored as warnings
     """
     if template_db_name:
         ui.echo(f"🥡 Creating template {template_db_name} from dump {db_dump}")
-        _load_database(template_db_name, db_dump)
+        _load_database(template_db_name, db_dump, jobs=jobs, check=check)
         ui.echo(f"🥡 Restore database {db_name} from template {template_db_name}")
         _restore_database_from_template(db_name, template_db_name)
     else:
         ui.echo(f"🥡 Restore database {db_name} from dump {db_dump}")
-        _load_database(db_name, db_dump)
+        _load_database(db_name, db_dump, jobs=jobs, check=check)
 
 
 def create_db_from_db_template(db_name: str, db_template: str):
@@ -50,37 +75,61 @@ def create_db_from_odoo_archive(
     db_name: str,
     backup_path: PathLike | str,
     template_db_name: str | None = None,
+    incremental_filestore: bool = False,
 ):
     """Restores a DB from an Odoo archive
 
+    Nothing is extracted to disk: ``dump.sql`` is streamed from the archive to
+    ``psql`` while the filestore, if any, is streamed to the container.
+
     :param str db_name: name of the DB to create
     :param str backup_path: path to the Odoo archive to restore
     :param str template_db_name: if set, a new template DB of the given name is created
+    :param bool incremental_filestore: if set, only the filestore files missing
+        from the existing filestore of the DB are copied
     """
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        tmp_dir_path = Path(tmp_dir)
-        with zipfile.ZipFile(backup_path) as backup:
-            backup.extractall(path=tmp_dir_path)
-        # Restore the database
-        dump_sql_path = tmp_dir_path / "dump.sql"
-        if not dump_sql_path.is_file():
+    with (
+        _report_duration("Restore"),
+        zipfile.ZipFile(backup_path) as backup,
+    ):
+        if "dump.sql" not in backup.namelist():
             ui.exit_msg(f"No dump.sql found in {backup_path}")
-        create_db_from_db_dump(db_name, dump_sql_path, template_db_name)
-        # Restore the filestore (optional, may be missing)
-        filestore_path = tmp_dir_path / "filestore"
-        if filestore_path.is_dir():
-            ui.echo(f"🥡 Restoring filestore from {filestore_path}..")
-            _load_filestore(db_name, filestore_path)
+        has_filestore = any(
+            name.startswith(FILESTORE_PREFIX) for name in backup.namelist()
+        )
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            # Restore the filestore (optional, may be missing) meanwhile
+            filestore_future = None
+            if has_filestore:
+                ui.echo(f"🥡 Restoring filestore from {backup_path}..")
+                filestore_future = pool.submit(
+                    _load_filestore, db_name, backup_path, incremental_filestore
+                )
+            # Restore the database
+            load_db_name = template_db_name or db_name
+            ui.echo(f"🥡 Restore database {load_db_name} from {backup_path}")
+            with _report_duration(f"Database {load_db_name} restore"):
+                _load_database_from_stream(load_db_name, backup.open("dump.sql"))
+            if template_db_name:
+                ui.echo(
+                    f"🥡 Restore database {db_name} from template {template_db_name}"
+                )
+                with _report_duration(f"Database {db_name} restore"):
+                    _restore_database_from_template(db_name, template_db_name)
+            if filestore_future:
+                filestore_future.result()
 
 
 def create_db_from_local_files(
     db_name: str,
     template_db_name: str | None = None,
+    jobs: int | None = None,
 ):
     """Checks current directory for ``.pg`` files and tries to restore one of them
 
     :param str db_name: name of the DB to create
     :param str template_db_name: if set, a new template DB of the given name is created
+    :param int jobs: number of parallel restore jobs, defaults to the CPU cores
     """
     if dumps := [d.name for d in Path().absolute().glob("*.pg") if d.is_file()]:
         dumps.sort()  # Sort alphabetically to make it easier to read for users
@@ -91,7 +140,7 @@ def create_db_from_local_files(
         )
         key = ui.ask_question("Enter the number of the DB dump to restore", type=int)
         if db_dump := choices.get(key):
-            create_db_from_db_dump(db_name, db_dump, template_db_name)
+            create_db_from_db_dump(db_name, db_dump, template_db_name, jobs=jobs)
         else:
             ui.exit_msg(
                 f"Invalid selection: {key} not found in {', '.join(map(str, choices))}"
@@ -101,60 +150,84 @@ def create_db_from_local_files(
 
 
 def dump_db(
-    db_name: str, output_path: PathLike | str = ".", format: Literal["c", "p"] = "c"
+    db_name: str,
+    output_path: PathLike | str = ".",
+    format: Literal["c", "p", "d"] = "c",
+    jobs: int | None = None,
+    compress: str | None = None,
 ):
-    """Dump a database to a file"""
+    """Dump a database to a file
+
+    The dump is written in place, and only shows up at the output path once
+    complete. Directory format dumps (``d``) are written by ``pg_dump`` with
+    parallel ``jobs``, one per CPU core by default.
+
+    :param str compress: compression method and/or level given to ``pg_dump``,
+        e.g: ``6``, ``zstd:3`` or ``lz4`` (the latter needs PostgreSQL 16+)
+    """
     output_path = Path(output_path)
     # If output_path is a directory, generate a filename
     if output_path.is_dir() or output_path.as_posix().endswith("/"):
         username = getpass.getuser()
         project_name = proj.get_project_manifest_key("project_name")
         timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-        filename = f"{username}_{project_name}-{timestamp}.pg"
+        suffix = "" if format == "d" else ".pg"
+        filename = f"{username}_{project_name}-{timestamp}{suffix}"
         output_path = output_path / filename
     # Make sure the target directory exists
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    # Create a temporary directory to mount onto the container as volume
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        # Dump it
-        local_volume_path = Path(tmp_dir)
-        local_dump_path = local_volume_path / output_path.name
-        container_volume_path = Path("/tmp/otools_db")
-        container_dump_path = container_volume_path / output_path.name
+    # Mount the target directory onto the container, and dump next to the
+    # output path: no copy is needed to put the dump in place
+    container_volume_path = Path("/tmp/otools_db")
+    with atomic_output(output_path) as tmp_output_path:
+        pg_dump = [
+            "pg_dump",
+            "--format",
+            format,
+            "--file",
+            str(container_volume_path / tmp_output_path.name),
+        ]
+        if format == "d":
+            pg_dump += ["--jobs", str(jobs or os.cpu_count())]
+        if compress:
+            pg_dump += ["--compress", compress]
+        pg_dump.append(db_name)
         command = docker_compose.run(
             "odoo",
-            [
-                "pg_dump",
-                "--format",
-                format,
-                "--file",
-                str(container_dump_path),
-                db_name,
-            ],
+            pg_dump,
             tty=True,
             quiet=True,
-            volumes=[(local_volume_path, container_volume_path)],
+            volumes=[(output_path.parent.absolute(), container_volume_path)],
         )
         os_exec.run(command, check=True)
-        os_exec.run(f"mv {local_dump_path} {output_path}", check=True)
     ui.echo(f"Dump successfully generated at {output_path}")
     return output_path
 
 
 def _restore_database_from_template(db_name, template):
-    os_exec.run(docker_compose.drop_db(db_name))
-    os_exec.run(docker_compose.restore_db_from_template(db_name, template))
+    drop_database(db_name)
+    create_database(db_name, template=template)
+
+
+def _is_dump_directory(path: Path) -> bool:
+    """Whether the path is a directory-format dump (``pg_dump -Fd``)"""
+    return (path / "toc.dat").is_file()
 
 
-def _load_database(db_name, fname):
-    os_exec.run(docker_compose.drop_db(db_name))
-    os_exec.run(docker_compose.create_db(db_name))
+def _load_database(db_name, fname, jobs=None, check=False):
+    drop_database(db_name)
+    create_database(db_name)
 
-    if Path(fname).is_file():
-        format = "sql" if Path(fname).suffix == ".sql" else "dump"
+    path = Path(fname)
+    if path.is_file() or _is_dump_directory(path):
+        format = "sql" if path.suffix == ".sql" else "dump"
         try:
-            docker_compose.run_restore_db(db_name, fname, format=format)
+            docker_compose.run_restore_db(
+                db_name, fname, format=format, jobs=jobs or os.cpu_count(), check=check
+            )
         except Exception:
+            if check:
+                raise
             # to ignore warnings on db restore
             pass
     else:
@@ -163,36 +236,138 @@ def _load_database(db_name, fname):
     return fname
 
 
-def _load_filestore(db_name: str, filestore_path: PathLike | str):
-    """Load the filestore into the container"""
+def _load_database_from_stream(db_name: str, sql_file: IO[bytes]):
+    """Load a plain SQL dump read from a file object into a new database"""
+    drop_database(db_name)
+    create_database(db_name)
+    # psql needs the PG* variables set by the entrypoint of the image
+    command = docker_compose.run("odoo", ["psql", "-d", db_name], tty=True, quiet=True)
+    # Errors are ignored, to ignore warnings on db restore
+    _pipe_to_command(command, lambda stdin: shutil.copyfileobj(sql_file, stdin))
+
+
+def _load_filestore(
+    db_name: str, backup_path: PathLike | str, incremental: bool = False
+):
+    """Load the filestore of an Odoo archive into the container
+
+    The filestore files are streamed to the container as a tar archive.
+
+    Filestore files are named after the checksum of their content: when
+    ``incremental``, the files already found in the existing filestore, with
+    the same name and size, are skipped. The files not found in the archive
+    are removed.
+    """
     # First, read the container odoo.cfg to know where the filestore is located
     cfg = docker_compose.read_odoo_cfg()
     options_data_dir = cfg.get("options", "data_dir")
     if not options_data_dir:
         raise ui.exit_msg("No data_dir found in odoo.cfg")
     container_filestore_path = Path(options_data_dir) / "filestore" / db_name
-    # Remove the existing filestore, if any
-    os_exec.run(
-        docker_compose.run(
+    with _report_duration(f"Filestore {db_name} restore"):
+        with zipfile.ZipFile(backup_path) as backup:
+            members = {
+                info.filename[len(FILESTORE_PREFIX) :]: info
+                for info in backup.infolist()
+                if info.filename.startswith(FILESTORE_PREFIX) and not info.is_dir()
+            }
+        if incremental:
+            existing_files = _get_container_files(container_filestore_path)
+            stale_files = [name for name in existing_files if name not in members]
+            if stale_files:
+                _remove_container_files(container_filestore_path, stale_files)
+            # Files of the same size are left in place
+            unchanged_files = {
+                name
+                for name, info in members.items()
+                if existing_files.get(name) == info.file_size
+            }
+            members = {
+                name: info
+                for name, info in members.items()
+                if name not in unchanged_files
+            }
+            ui.echo(
+                f"🥡 Filestore {db_name}: {len(members)} files to copy, "
+                f"{len(unchanged_files)} unchanged, {len(stale_files)} removed"
+            )
+            script = 'mkdir -p "$0" && tar -x -C "$0"'
+        else:
+            # Replace the existing filestore, if any, by the extracted one
+            script = 'rm -rf "$0" && mkdir -p "$0" && tar -x -C "$0"'
+        # The entrypoint of the image switches to the user owning the filestore
+        command = docker_compose.run(
             "odoo",
-            ["rm", "-rf", str(container_filestore_path)],
-            remove=False,  # Don't remove the container, we need it for the copy
-        ),
-        verbose=True,
-        check=True,
-    )
-    # Copy the filestore to the container
-    os_exec.run(
+            ["sh", "-c", script, str(container_filestore_path)],
+            tty=True,
+            # Don't remove the container: its anonymous volumes would go with it
+            remove=False,
+        )
+
+        def write_tar(stdin):
+            with (
+                zipfile.ZipFile(backup_path) as backup,
+                tarfile.open(fileobj=stdin, mode="w|") as tar,
+            ):
+                for name, info in members.items():
+                    tar_info = tarfile.TarInfo(name)
+                    tar_info.size = info.file_size
+                    tar_info.mtime = int(datetime(*info.date_time).timestamp())
+                    with backup.open(info) as member:
+                        tar.addfile(tar_info, member)
+
+        if returncode := _pipe_to_command(command, write_tar):
+            raise subprocess.CalledProcessError(returncode, command)
+
+
+def _get_container_files(container_path: Path) -> dict[str, int]:
+    """Return the size of the files found under a path of the odoo container"""
+    command = docker_compose.run(
+        "odoo",
         [
-            "docker",
-            "compose",
-            "cp",
-            f"{filestore_path}/.",
-            f"odoo:{container_filestore_path}",
+            "sh",
+            "-c",
+            '[ ! -d "$0" ] || find "$0" -type f -printf "%s %P\\n"',
+            str(container_path),
         ],
-        verbose=True,
-        check=True,
+        tty=True,
     )
+    files = {}
+    for line in os_exec.run(command, check=True).splitlines():
+        size, name = line.split(" ", 1)
+        files[name] = int(size)
+    return files
+
+
+def _remove_container_files(container_path: Path, names: list[str]):
+    """Remove files given relatively to a path of the odoo container"""
+    command = docker_compose.run(
+        "odoo",
+        ["sh", "-c", 'cd "$0" && xargs -0 rm -f --', str(container_path)],
+        tty=True,
+    )
+    data = b"\0".join(name.encode() for name in names)
+    if returncode := _pipe_to_command(command, lambda stdin: stdin.write(data)):
+        raise subprocess.CalledProcessError(returncode, command)
+
+
+@contextmanager
+def _report_duration(stage: str):
+    """Report how long a stage of a process took"""
+    start = time.perf_counter()
+    yield
+    ui.echo(f"⏱️  {stage} done in {time.perf_counter() - start:.1f}s")
+
+
+def _pipe_to_command(command: list[str], write: Callable[[IO[bytes]], object]) -> int:
+    """Run a command, with ``write`` feeding its stdin, and return its exit code"""
+    with subprocess.Popen(command, stdin=subprocess.PIPE) as process:
+        stdin = process.stdin
+        assert stdin is not None
+        # The command may exit early: its exit code tells why
+        with suppress(BrokenPipeError), stdin:
+            write(stdin)
+    return process.returncode
 
 
 @contextmanager
@@ -223,14 +398,134 @@ def get_db_port() -> int:
     return int(result.split(":")[-1])
 
 
-def execute_db_request(dbname: str, sql: str) -> list[tuple]:
-    """Execute a SQL request on the given database."""
-    with ensure_db_container_up() as db_port:
-        dsn = f"host=localhost dbname={dbname} user=odoo password=odoo port={db_port}"
-        with psycopg2.connect(dsn) as db_connection:
-            with db_connection.cursor() as db_cursor:
-                db_cursor.execute(sql)
-                return db_cursor.fetchall()
+class ConnectionManager:
+    """Connections to the databases of the database container
+
+    The port of the container is resolved once, starting the container if
+    needed. Connections are kept open for the whole process, in autocommit
+    mode, and reused: each of them serves one query at a time, so that
+    several threads can query the databases concurrently.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._port: int | None = None
+        self._idle_connections: dict[str, list] = {}
+        atexit.register(self.close)
+
+    @property
+    def port(self) -> int:
+        with self._lock:
+            if self._port is None:
+                with ensure_db_container_up() as port:
+                    self._port = port
+            return self._port
+
+    @contextmanager
+    def connection(self, dbname: str):
+        """Borrow a connection to the given database"""
+        port = self.port
+        with self._lock:
+            idle_connections = self._idle_connections.setdefault(dbname, [])
+            connection = idle_connections.pop() if idle_connections else None
+        if connection is None or connection.closed:
+            dsn = f"host=localhost dbname={dbname} user=odoo password=odoo port={port}"
+            connection = psycopg2.connect(dsn)
+            connection.autocommit = True
+        # Until proven otherwise, e.g: on KeyboardInterrupt
+        broken = True
+        try:
+            yield connection
+            broken = False
+        except psycopg2.Error as error:
+            # Errors of the queries leave the connection usable (autocommit)
+            broken = isinstance(
+                error, (psycopg2.OperationalError, psycopg2.InterfaceError)
+            )
+            raise
+        finally:
+            # Never leave a connection open out of the pool: it would prevent
+            # dropping or cloning the database
+            if broken or connection.closed:
+                connection.close()
+            else:
+                with self._lock:
+                    self._idle_connections.setdefault(dbname, []).append(connection)
+
+    def execute(self, dbname: str, sql, params=None) -> list[tuple]:
+        """Execute a SQL request, and return the fetched rows, if any"""
+        with self.connection(dbname) as connection, connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall() if cursor.description else []
+
+    def close(self, dbname: str | None = None):
+        """Close the idle connections, to the given database only if set
+
+        A database can't be dropped or used as a template while connected to.
+        """
+        with self._lock:
+            dbnames = [dbname] if dbname else list(self._idle_connections)
+            for name in dbnames:
+                for connection in self._idle_connections.pop(name, []):
+                    connection.close()
+
+
+@cache
+def get_connection_manager() -> ConnectionManager:
+    return ConnectionManager()
+
+
+def drop_database(db_name: str):
+    """Drop a database, if it exists"""
+    manager = get_connection_manager()
+    manager.close(db_name)
+    manager.execute(
+        "postgres",
+        sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(db_name)),
+    )
+
+
+def create_database(db_name: str, template: str | None = None):
+    """Create a database, optionally as a copy of a template database"""
+    manager = get_connection_manager()
+    query = sql.SQL("CREATE DATABASE {}").format(sql.Identifier(db_name))
+    if template:
+        # A database can't be cloned while connected to
+        manager.close(template)
+        query += sql.SQL(" TEMPLATE {}").format(sql.Identifier(template))
+    manager.execute("postgres", query)
+
+
+def execute_db_request(dbname: str, sql, params=None) -> list[tuple]:
+    """Execute a SQL request on the given database.
+
+    Returns the fetched rows, if the request returns any.
+    """
+    return get_connection_manager().execute(dbname, sql, params)
+
+
+def execute_db_requests(
+    dbnames: list[str],
+    sql,
+    params=None,
+    ignored_errors: tuple[type[Exception], ...] = (),
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> dict[str, list[tuple] | None]:
+    """Execute a SQL request on several databases concurrently.
+
+    Returns the fetched rows of each database, or ``None`` for the databases
+    the request failed on with one of the ``ignored_errors``.
+    """
+    manager = get_connection_manager()
+
+    def execute(dbname):
+        try:
+            return manager.execute(dbname, sql, params)
+        except ignored_errors:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return dict(zip(dbnames, pool.map(execute, dbnames), strict=True))
 
 
 def get_db_list() -> list[str]:
@@ -242,3 +537,95 @@ def get_db_list() -> list[str]:
         AND datname not in ('postgres', 'odoo');
     """
     return [row[0] for row in execute_db_request("postgres", sql)]
+
+
+def get_marabunta_versions(
+    use_cache: bool = True, max_workers: int = DEFAULT_MAX_WORKERS
+) -> dict[str, tuple[datetime | None, str | None]]:
+    """Return the latest Marabunta version of each database, and its date.
+
+    Databases without Marabunta are found with a cheap probe, and not queried.
+    The versions are cached on disk: a database is only queried again once
+    it was written to (according to the statistics of the server), or if it
+    was recreated.
+    """
+    rows = execute_db_request(
+        "postgres",
+        """
+        SELECT d.datname, d.oid, s.tup_inserted, s.tup_updated, s.tup_deleted
+        FROM pg_database d
+        LEFT JOIN pg_stat_database s ON s.datid = d.oid
+        WHERE d.datistemplate = false
+        AND d.datname not in ('postgres', 'odoo');
+        """,
+    )
+    cache_keys = {datname: list(key) for datname, *key in rows}
+    cache = _read_marabunta_versions_cache() if use_cache else {}
+    versions = {}
+    for db_name, key in cache_keys.items():
+        entry = cache.get(db_name)
+        if entry and entry["key"] == key:
+            date_done, number = entry["version"]
+            versions[db_name] = (
+                date_done and datetime.fromisoformat(date_done),
+                number,
+            )
+    if outdated := [db_name for db_name in cache_keys if db_name not in versions]:
+        probes = execute_db_requests(
+            outdated,
+            "SELECT to_regclass('marabunta_version') IS NOT NULL;",
+            max_workers=max_workers,
+        )
+        fetched = execute_db_requests(
+            [
+                db_name
+                for db_name in outdated
+                if (probe := probes[db_name]) and probe[0][0]
+            ],
+            """
+            SELECT date_done, number
+            FROM marabunta_version
+            ORDER BY date_done DESC
+            LIMIT 1;
+            """,
+            # In case the table was dropped in the meantime
+            ignored_errors=(psycopg2.ProgrammingError,),
+            max_workers=max_workers,
+        )
+        for db_name in outdated:
+            version_fetch = fetched.get(db_name)
+            versions[db_name] = version_fetch[0] if version_fetch else (None, None)
+    cache = {}
+    for db_name, key in cache_keys.items():
+        date_done, number = versions[db_name]
+        cache[db_name] = {
+            "key": key,
+            "version": [date_done.isoformat() if date_done else None, number],
+        }
+    _write_marabunta_versions_cache(cache)
+    return versions
+
+
+def _get_marabunta_versions_cache_path() -> Path:
+    # Databases of different projects live in different containers
+    project_hash = hashlib.sha1(
+        str(root_path(raise_if_missing=False)).encode()
+    ).hexdigest()[:12]
+    return get_cache_path() / f"marabunta-versions-{project_hash}.json"
+
+
+def _read_marabunta_versions_cache() -> dict:
+    try:
+        return json.loads(_get_marabunta_versions_cache_path().read_text())
+    except (OSError, ValueError) as exc:
+        logger.debug("Cannot read Marabunta versions cache: %s", exc)
+        return {}
+
+
+def _write_marabunta_versions_cache(cache: dict):
+    path = _get_marabunta_versions_cache_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(cache))
+    except OSError as exc:
+        logger.debug("Cannot write Marabunta versions cache: %s", exc)
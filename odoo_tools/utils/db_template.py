@@ -0,0 +1,334 @@
+# Copyright 2025 Camptocamp SA (https://www.camptocamp.com).
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+"""
+Pool of template databases, created from database dumps.
+
+Restoring a dump takes a while, while cloning a database with
+``createdb -T`` is quick: each dump restored through the pool is restored
+once into a template database, then cloned as many times as needed. Other
+slow to create databases, like the translation databases of
+``otools-i18n export``, are pooled the same way.
+
+Templates are named after a hash of what they're created from, e.g. the
+contents of a dump whatever its name. Their metadata (dump, creation and last
+use dates) is stored as a JSON comment on the template database itself, so
+that the pool lives along with the databases of the project.
+"""
+
+import hashlib
+import json
+import logging
+import re
+from collections.abc import Callable
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from os import PathLike
+from pathlib import Path
+
+from psycopg2 import sql
+
+from . import db, ui
+from .misc import get_cache_path
+from .path import atomic_output
+
+logger = logging.getLogger(__name__)
+
+#: Prefix of the names of the template databases of the pool
+TEMPLATE_PREFIX = "otools_tpl_"
+
+#: Size of the chunks the dump files are read by, to hash them
+HASH_CHUNK_SIZE = 1024**2
+
+#: File of the cache directory holding the hashes of the dump files, along
+#: with their size and modification time
+HASH_CACHE_FILENAME = "dump-hashes.json"
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+@dataclass
+class Template:
+    name: str
+    size: int
+    dump: str | None = None
+    created: datetime | None = None
+    last_used: datetime | None = None
+
+    @property
+    def complete(self) -> bool:
+        """Whether the template was fully restored (its metadata is set last)"""
+        return self.created is not None
+
+
+def parse_size(size: str) -> int:
+    """Parse a size such as ``500M`` or ``20G`` to a number of bytes"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMGT]?)I?B?", size.strip().upper())
+    if not match:
+        raise ValueError(f"invalid size: {size!r}")
+    number, unit = match.groups()
+    return int(float(number) * SIZE_UNITS[unit])
+
+
+def get_dump_hash(dump_path: PathLike | str) -> str:
+    """Return a hash identifying the contents of a database dump
+
+    The name of the dump isn't part of it, only the names of the files of a
+    directory format dump are. Hashing a dump of several gigabytes takes a
+    while: the hash of each file is cached along with its size and
+    modification time, so that it is only computed once.
+    """
+    dump_path = Path(dump_path)
+    if dump_path.is_dir():
+        files = sorted(path for path in dump_path.rglob("*") if path.is_file())
+    else:
+        files = [dump_path]
+    cache = _read_hash_cache()
+    digest = hashlib.sha256()
+    for path in files:
+        digest.update(f"{path.relative_to(dump_path).as_posix()}\0".encode())
+        digest.update(_get_file_hash(path, cache).encode())
+    _write_hash_cache(cache)
+    return digest.hexdigest()
+
+
+def _get_file_hash(path: Path, cache: dict) -> str:
+    stat = path.stat()
+    key = str(path.resolve())
+    if cache.get(key, [None])[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return cache[key][2]
+    digest = hashlib.sha256()
+    with path.open("rb") as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    cache[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return cache[key][2]
+
+
+def _read_hash_cache() -> dict:
+    try:
+        return json.loads((get_cache_path() / HASH_CACHE_FILENAME).read_text())
+    except (OSError, ValueError) as exc:
+        logger.debug("Cannot read the dump hashes cache: %s", exc)
+        return {}
+
+
+def _write_hash_cache(cache: dict):
+    path = get_cache_path() / HASH_CACHE_FILENAME
+    # Forget the files removed since they were hashed
+    cache = {key: value for key, value in cache.items() if Path(key).is_file()}
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Several restores may run side by side
+        with atomic_output(path) as tmp_path:
+            tmp_path.write_text(json.dumps(cache))
+    except OSError as exc:
+        logger.debug("Cannot write the dump hashes cache: %s", exc)
+
+
+def get_template_name(dump_hash: str) -> str:
+    return f"{TEMPLATE_PREFIX}{dump_hash[:16]}"
+
+
+def list_templates() -> list[Template]:
+    """Return the templates of the pool, the least recently used first"""
+    rows = db.execute_db_request(
+        "postgres",
+        """
+        SELECT datname,
+            pg_database_size(datname),
+            shobj_description(oid, 'pg_database')
+        FROM pg_database
+        WHERE starts_with(datname, %s);
+        """,
+        (TEMPLATE_PREFIX,),
+    )
+    templates = []
+    for name, size, comment in rows:
+        template = Template(name=name, size=size)
+        try:
+            metadata = json.loads(comment or "")
+            template.dump = metadata["dump"]
+            template.created = datetime.fromisoformat(metadata["created"])
+            template.last_used = datetime.fromisoformat(metadata["last_used"])
+        except (ValueError, KeyError):
+            # Not fully restored, or not created by otools
+            pass
+        templates.append(template)
+    return sorted(templates, key=lambda t: t.last_used or datetime.min)
+
+
+def _save_metadata(template: Template):
+    metadata = {
+        "dump": template.dump,
+        "created": template.created and template.created.isoformat(),
+        "last_used": template.last_used and template.last_used.isoformat(),
+    }
+    db.execute_db_request(
+        "postgres",
+        sql.SQL("COMMENT ON DATABASE {} IS %s").format(sql.Identifier(template.name)),
+        (json.dumps(metadata),),
+    )
+
+
+def get_template(dump_path: PathLike | str, jobs: int | None = None) -> Template:
+    """Return the template of the pool for the given dump, creating it if needed"""
+    dump_path = Path(dump_path)
+    return ensure_template(
+        get_template_name(get_dump_hash(dump_path)),
+        source=dump_path.name,
+        # A template is reused by every restore: it must be complete
+        create=lambda name: db.create_db_from_db_dump(
+            name, dump_path, jobs=jobs, check=True
+        ),
+    )
+
+
+def ensure_template(
+    name: str, source: str, create: Callable[[str], object]
+) -> Template:
+    """Return the template of the pool with the given name, creating it if needed
+
+    :param str name: name of the template, see :func:`get_template_name`
+    :param str source: what the template is created from, e.g: a dump file name
+    :param create: function creating the database of the template, given its
+        name. It must raise if the database isn't fully created.
+    """
+    if template := _reuse_template(name):
+        return template
+    with _creation_lock(name):
+        # Another process may have created it meanwhile
+        if template := _reuse_template(name):
+            return template
+        ui.echo(f"🥡 Creating template {name} from {source}")
+        # Start over from an interrupted creation, if any. It may have been
+        # flagged as a template already.
+        drop_template(name)
+        try:
+            create(name)
+        except BaseException:
+            ui.echo(f"💥 Failed to create template {name}, dropping it")
+            drop_template(name)
+            raise
+        now = datetime.now()
+        template = Template(
+            name=name,
+            size=0,
+            dump=source,
+            created=now,
+            last_used=now,
+        )
+        # Flag the database as a template: it keeps it out of the databases
+        # listed by otools-db list
+        db.execute_db_request(
+            "postgres",
+            sql.SQL("ALTER DATABASE {} IS_TEMPLATE true").format(sql.Identifier(name)),
+        )
+        _save_metadata(template)
+    return template
+
+
+def _reuse_template(name: str) -> Template | None:
+    for template in list_templates():
+        if template.name == name and template.complete:
+            ui.echo(f"♻️  Reusing template {name} of {template.dump}")
+            template.last_used = datetime.now()
+            _save_metadata(template)
+            return template
+    return None
+
+
+@contextmanager
+def _creation_lock(name: str, wait: bool = True):
+    """Hold the lock of the creation of a template, shared by otools processes
+
+    It is a PostgreSQL advisory lock, released with the connection if the
+    process dies. Unless ``wait``, it isn't waited for: whether it was
+    acquired is yielded.
+    """
+    digest = hashlib.sha256(name.encode()).digest()
+    key = int.from_bytes(digest[:8], "big", signed=True)
+    with (
+        db.get_connection_manager().connection("postgres") as connection,
+        connection.cursor() as cursor,
+    ):
+        if wait:
+            cursor.execute("SELECT pg_advisory_lock(%s)", (key,))
+            acquired = True
+        else:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+            acquired = cursor.fetchone()[0]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (key,))
+
+
+def create_db_from_pool(
+    db_name: str,
+    dump_path: PathLike | str,
+    jobs: int | None = None,
+    budget: int | None = None,
+):
+    """Creates a DB by cloning the template of the pool for the given dump
+
+    :param str db_name: name of the DB to create
+    :param str dump_path: the DB dump to restore, if there's no template for it yet
+    :param int jobs: number of parallel restore jobs, defaults to the CPU cores
+    :param int budget: if set, disk size the templates of the pool are evicted
+        to fit in, least recently used first
+    """
+    template = get_template(dump_path, jobs=jobs)
+    ui.echo(f"🥡 Restore database {db_name} from template {template.name}")
+    db.create_db_from_db_template(db_name, template.name)
+    if budget is not None:
+        gc(budget, keep=[template.name])
+
+
+def drop_template(name: str):
+    """Drop a template of the pool, if it exists"""
+    # A database flagged as a template can't be dropped
+    if db.execute_db_request(
+        "postgres",
+        "SELECT 1 FROM pg_database WHERE datname = %s AND datistemplate",
+        (name,),
+    ):
+        db.execute_db_request(
+            "postgres",
+            sql.SQL("ALTER DATABASE {} IS_TEMPLATE false").format(sql.Identifier(name)),
+        )
+    db.drop_database(name)
+
+
+def gc(budget: int, keep: list[str] | None = None) -> list[Template]:
+    """Drop the least recently used templates until the pool fits in the budget
+
+    Incomplete templates, left by interrupted restores, are always dropped,
+    unless another process is creating them.
+
+    :param int budget: maximum disk size of the pool, in bytes
+    :param list keep: names of the templates not to drop
+    :return: the dropped templates
+    """
+    keep = keep or []
+    templates = list_templates()
+    pool_size = sum(template.size for template in templates)
+    dropped = []
+    for template in templates:
+        if template.name in keep:
+            continue
+        if template.complete and pool_size <= budget:
+            continue
+        with _creation_lock(template.name, wait=False) as acquired:
+            if not acquired:
+                # Being created
+                continue
+            ui.echo(
+                f"🗑️  Dropping template {template.name} "
+                f"({template.dump or 'incomplete'})"
+            )
+            drop_template(template.name)
+        pool_size -= template.size
+        dropped.append(template)
+    return dropped
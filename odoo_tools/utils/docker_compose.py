@@ -8,6 +8,7 @@ command line options found in different versions of docker compose.
 from __future__ import annotations
 
 import subprocess
+from functools import cache
 from os import PathLike
 from pathlib import Path
 from typing import TYPE_CHECKING, Literal
@@ -18,7 +19,17 @@ if TYPE_CHECKING:
     from configparser import ConfigParser
 
 
+#: Header of the custom-format archives written by ``pg_dump``
+PG_DUMP_CUSTOM_MAGIC = b"PGDMP"
+
+
+@cache
 def get_version():
+    """Return the version of docker compose, as a list of integers
+
+    It is resolved once per process: the command builders below need it to
+    pick their options, and some commands build dozens of them.
+    """
     version = os_exec.run("docker compose version --short")
     return [int(x) for x in version.split(".") if x.isdigit()]
 
@@ -115,37 +126,67 @@ def get_db_port():
     return command
 
 
-def drop_db(database_name):
-    command = run("odoo", ["dropdb", database_name], quiet=True)
-    return command
-
+def restore_db(database_name, dump_path=None, jobs=None, volumes=None):
+    """Return the ``pg_restore`` command, reading the dump from stdin by default.
 
-def create_db(database_name):
-    command = run("odoo", ["createdb", "-O", "odoo", database_name], quiet=True)
+    Parallel ``jobs`` need the dump to be a file (or directory) that can be
+    read from the container, e.g: mounted as one of the ``volumes``.
+    """
+    pg_restore = ["pg_restore", "-Oxd", database_name]
+    if jobs:
+        pg_restore += ["--jobs", str(jobs)]
+    if dump_path:
+        pg_restore.append(str(dump_path))
+    command = run("odoo", pg_restore, tty=True, quiet=True, volumes=volumes)
     return command
 
 
-def restore_db(database_name):
-    command = run("odoo", ["pg_restore", "-Oxd", database_name], tty=True, quiet=True)
-    return command
-
+def is_parallel_restorable(db_dump: Path) -> bool:
+    """Tell whether ``pg_restore`` can restore the dump with parallel jobs
 
-def restore_db_from_template(database_name, template_name):
-    command = run("odoo", ["createdb", "-T", template_name, database_name], quiet=True)
-    return command
+    That is a custom or directory format archive: tar ones can't be.
+    """
+    if db_dump.is_dir():
+        return True
+    with db_dump.open("rb") as fdump:
+        return fdump.read(len(PG_DUMP_CUSTOM_MAGIC)) == PG_DUMP_CUSTOM_MAGIC
 
 
 def run_restore_db(
-    database_name, db_dump: PathLike | str, format: Literal["sql", "dump"] = "dump"
+    database_name,
+    db_dump: PathLike | str,
+    format: Literal["sql", "dump"] = "dump",
+    jobs: int | None = None,
+    check: bool = False,
 ):
-    with Path(db_dump).open("rb") as fdump:
-        if format == "sql":
-            command = run("odoo", ["psql", "-d", database_name], tty=True, quiet=True)
-        else:
-            command = restore_db(database_name)
-        # Execute
-        popen = subprocess.Popen(command, stdin=fdump, bufsize=1024**3)
-        popen.communicate()
+    """Restore a dump into an existing database.
+
+    Plain SQL dumps are streamed to ``psql``. Archives (custom or directory
+    format) are mounted into the container, for ``pg_restore`` to restore
+    them with parallel ``jobs``.
+
+    With ``check``, any error of the restore raises ``CalledProcessError``,
+    rather than being ignored as a warning.
+    """
+    db_dump = Path(db_dump)
+    if format == "sql":
+        psql = ["psql", "-d", database_name]
+        if check:
+            psql += ["-v", "ON_ERROR_STOP=1"]
+        command = run("odoo", psql, tty=True, quiet=True)
+        with db_dump.open("rb") as fdump:
+            subprocess.run(command, stdin=fdump, check=check)
+        return
+    container_volume_path = Path("/tmp/otools_restore")
+    if not is_parallel_restorable(db_dump):
+        jobs = None
+    command = restore_db(
+        database_name,
+        dump_path=container_volume_path / db_dump.name,
+        jobs=jobs,
+        volumes=[(db_dump.absolute().parent, container_volume_path)],
+    )
+    subprocess.run(command, check=check)
 
 
 def run_printenv(service="odoo") -> dict[str, str]:
@@ -385,6 +385,30 @@ def tag_signing_enabled(repo):
             return False
 
 
+def get_changed_files(rev_range: str | None = None) -> list[Path]:
+    """Return the files changed in a revision range, relative to the project root.
+
+    Without ``rev_range``, the uncommitted changes are returned instead, the
+    untracked files included. A submodule whose commit changed is returned as
+    a whole, as its path. Renamed files are returned as both their old and
+    their new path, as they change the addons they're moved from too.
+    """
+    cwd = root_path()
+    diff_cmd = [
+        "git",
+        "diff",
+        "--name-only",
+        "--no-renames",
+        "--relative",
+        rev_range or "HEAD",
+    ]
+    output = run(diff_cmd, cwd=cwd, check=True)
+    if not rev_range:
+        untracked_cmd = ["git", "ls-files", "--others", "--exclude-standard"]
+        output += "\n" + run(untracked_cmd, cwd=cwd, check=True)
+    return [Path(line) for line in output.splitlines() if line]
+
+
 def delete_branch(branch_name):
     run(["git", "branch", "-D", branch_name])
 
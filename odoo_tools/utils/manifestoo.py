@@ -3,18 +3,39 @@
 
 from __future__ import annotations
 
-from collections.abc import Iterable
+import ast
+import heapq
+import logging
+import os
+from collections import defaultdict
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fnmatch import fnmatchcase
+from functools import cache, cached_property
+from itertools import chain
 from pathlib import Path
+from typing import Any
 
 from manifestoo.addons_selection import AddonsSelection
 from manifestoo.commands.list import list_command
-from manifestoo.commands.list_codepends import list_codepends_command
-from manifestoo.commands.list_depends import list_depends_command
+from manifestoo_core.addon import Addon
 from manifestoo_core.addons_set import AddonsSet
+from manifestoo_core.manifest import InvalidManifest, Manifest, get_manifest_path
 
 from . import ui
+from .click import DEFAULT_MAX_WORKERS
 from .config import config
-from .path import build_path
+from .path import build_path, is_odoo_module, root_path
+
+logger = logging.getLogger(__name__)
+
+#: Under this number of manifests, evaluating them right away is faster than
+#: starting a process pool to spread the work.
+PARALLEL_PARSE_THRESHOLD = 500
+
+#: Characters with a special meaning in the patterns of ``fnmatch``
+GLOB_CHARS = frozenset("*?[")
 
 
 def get_addons_dirs() -> list[Path]:
@@ -35,11 +56,311 @@ def get_addons_dirs() -> list[Path]:
     return addons_dirs
 
 
+def _scan_addons_dir(addons_dir: Path) -> list[Path]:
+    """Return the manifest path of each module found in a directory."""
+    if not addons_dir.is_dir():
+        logger.debug("ignoring %s: not a directory", addons_dir)
+        return []
+    return [
+        manifest_path
+        for manifest_path in map(get_manifest_path, addons_dir.iterdir())
+        if manifest_path
+    ]
+
+
+def _read_manifest(manifest_path: Path) -> str | None:
+    """Return the source of a manifest, if its module is a valid addon.
+
+    Only the file system checks of manifestoo's ``Addon.from_addon_dir`` are
+    done here: the manifests are evaluated later on, possibly in a worker
+    process.
+    """
+    addon_dir = manifest_path.parent
+    if not (addon_dir / "__init__.py").is_file():
+        logger.debug("ignoring %s: missing an __init__.py", addon_dir)
+        return None
+    try:
+        return manifest_path.read_text()
+    except OSError as exc:
+        logger.debug("ignoring %s: %s", addon_dir, exc)
+        return None
+
+
+def _parse_manifests(sources: list[str]) -> list[Any]:
+    """Evaluate manifest sources, the invalid ones being returned as ``None``."""
+    manifests = []
+    for source in sources:
+        try:
+            manifests.append(ast.literal_eval(source))
+        except (SyntaxError, ValueError):
+            manifests.append(None)
+    return manifests
+
+
+def _parse_manifests_in_pool(sources: list[str]) -> list[Any]:
+    """Evaluate manifest sources, spread over a pool of processes.
+
+    ``ast.literal_eval`` is CPU-bound and holds the GIL, so threads would not
+    help here. Small batches are evaluated in the current process, as well as
+    all of them if no process pool can be started.
+    """
+    workers = os.cpu_count() or 1
+    if len(sources) < PARALLEL_PARSE_THRESHOLD or workers == 1:
+        return _parse_manifests(sources)
+    # A few chunks per worker keeps them all busy until the end, without
+    # paying the pickling overhead for every single manifest
+    chunk_size = -(-len(sources) // (workers * 4))
+    chunks = [
+        sources[idx : idx + chunk_size] for idx in range(0, len(sources), chunk_size)
+    ]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(chain.from_iterable(pool.map(_parse_manifests, chunks)))
+    except (OSError, BrokenProcessPool) as exc:
+        logger.debug("cannot parse manifests in a process pool: %s", exc)
+        return _parse_manifests(sources)
+
+
+class AddonsIndex:
+    """Index of the modules found in a list of addons directories.
+
+    The directories are scanned once, concurrently, ``max_workers`` at a
+    time. The index maps every module name to all of its locations, in the
+    order of the directories, so that lookups don't touch the file system
+    and shadowed modules can be spotted. The manifests are only read and
+    evaluated when the addons set is needed.
+    """
+
+    def __init__(
+        self, addons_dirs: Iterable[Path], max_workers: int = DEFAULT_MAX_WORKERS
+    ):
+        self.addons_dirs = list(addons_dirs)
+        self.max_workers = max_workers
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            self.manifest_paths: list[Path] = list(
+                chain.from_iterable(pool.map(_scan_addons_dir, self.addons_dirs))
+            )
+        #: Module name -> module directories
+        self.locations: dict[str, list[Path]] = {}
+        for manifest_path in self.manifest_paths:
+            self.locations.setdefault(manifest_path.parent.name, []).append(
+                manifest_path.parent
+            )
+
+    def find(self, pattern: str) -> dict[str, list[Path]]:
+        """Return the locations of the modules matching a name or a glob pattern.
+
+        E.g: ``sale_*`` matches all the modules prefixed with ``sale_``.
+        """
+        if not GLOB_CHARS.intersection(pattern):
+            # A plain module name: no need to match it against every module
+            if pattern in self.locations:
+                return {pattern: self.locations[pattern]}
+            return {}
+        return {
+            name: self.locations[name]
+            for name in sorted(self.locations)
+            if fnmatchcase(name, pattern)
+        }
+
+    @property
+    def duplicates(self) -> dict[str, list[Path]]:
+        """The locations of the modules found in several directories."""
+        return {
+            name: locations
+            for name, locations in sorted(self.locations.items())
+            if len(locations) > 1
+        }
+
+    @cached_property
+    def addons(self) -> list[Addon]:
+        """The valid addons, shadowed ones included, in the directories order.
+
+        The manifests are read concurrently and evaluated in a process pool.
+        """
+        # Read by chunks: a task per manifest would cost more than the read
+        paths = self.manifest_paths
+        chunks = [paths[idx : idx + 64] for idx in range(0, len(paths), 64)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            sources = list(
+                chain.from_iterable(
+                    pool.map(lambda chunk: list(map(_read_manifest, chunk)), chunks)
+                )
+            )
+        candidates = [
+            (manifest_path, source)
+            for manifest_path, source in zip(self.manifest_paths, sources, strict=True)
+            if source is not None
+        ]
+        manifest_dicts = _parse_manifests_in_pool([source for __, source in candidates])
+        addons = []
+        for (manifest_path, __), manifest_dict in zip(
+            candidates, manifest_dicts, strict=True
+        ):
+            try:
+                if manifest_dict is None:
+                    raise InvalidManifest(
+                        f"Manifest {manifest_path} has invalid syntax"
+                    )
+                manifest = Manifest.from_dict(manifest_dict, source=str(manifest_path))
+                if not manifest.installable:
+                    logger.debug("ignoring %s: not installable", manifest_path.parent)
+                    continue
+            except InvalidManifest as exc:
+                logger.debug("ignoring %s: %s", manifest_path.parent, exc)
+                continue
+            addons.append(Addon(manifest, manifest_path))
+        return addons
+
+    @cached_property
+    def addons_set(self) -> AddonsSet:
+        """The addons set, as manifestoo's ``AddonsSet.add_from_addons_dirs``.
+
+        Like with manifestoo, an addon found in several directories is taken
+        from the last one.
+        """
+        addons_set = AddonsSet()
+        for addon in self.addons:
+            addons_set[addon.name] = addon
+        return addons_set
+
+
+def load_addons_set(
+    addons_dirs: Iterable[Path], max_workers: int = DEFAULT_MAX_WORKERS
+) -> AddonsSet:
+    """Return the set of addons found in the given directories.
+
+    This is equivalent to manifestoo's ``AddonsSet.add_from_addons_dirs``, but
+    the directories are scanned concurrently, ``max_workers`` at a time, and
+    the manifests are evaluated in a process pool.
+    """
+    return AddonsIndex(addons_dirs, max_workers=max_workers).addons_set
+
+
+@cache
+def get_addons_index() -> AddonsIndex:
+    """Return the index of the project's addons directories.
+
+    It is built once per process, and shared by all the addons lookups.
+    """
+    return AddonsIndex(get_addons_dirs())
+
+
 def get_addons_set() -> AddonsSet:
     """Return the set of all addons found in the project's addons directories."""
-    addons_set = AddonsSet()
-    addons_set.add_from_addons_dirs(get_addons_dirs())
-    return addons_set
+    return get_addons_index().addons_set
+
+
+class DependencyGraph:
+    """The dependency graph of an addons set.
+
+    It is built once, holding the direct dependencies of every addon along
+    with the reverse map of their direct co-dependencies, so that it can
+    answer any number of queries without scanning the whole set each time.
+    The transitive closures are memoized: each of them is computed at most
+    once, reusing the closures already known on the way.
+
+    Dependencies that are not part of the addons set are part of the graph,
+    as leaves: they are reported by the queries, like manifestoo does.
+    """
+
+    def __init__(self, addons_set: AddonsSet):
+        self.addons_set = addons_set
+        #: Addon name -> names of its direct dependencies
+        self.depends_map: dict[str, frozenset[str]] = {
+            name: frozenset(addon.manifest.depends)
+            for name, addon in addons_set.items()
+        }
+        codepends_map: defaultdict[str, set[str]] = defaultdict(set)
+        for name, depends in self.depends_map.items():
+            for depend in depends:
+                codepends_map[depend].add(name)
+        #: Addon name -> names of the addons directly depending on it
+        self.codepends_map: dict[str, frozenset[str]] = {
+            name: frozenset(codepends) for name, codepends in codepends_map.items()
+        }
+        self._depends_closures: dict[str, frozenset[str]] = {}
+        self._codepends_closures: dict[str, frozenset[str]] = {}
+
+    @staticmethod
+    def _closure(
+        name: str,
+        adjacency: Mapping[str, frozenset[str]],
+        closures: dict[str, frozenset[str]],
+    ) -> frozenset[str]:
+        """Return (and memoize) the nodes reachable from ``name``."""
+        if name in closures:
+            return closures[name]
+        result: set[str] = set()
+        stack = [name]
+        while stack:
+            for node in adjacency.get(stack.pop(), ()):
+                if node in result:
+                    continue
+                result.add(node)
+                if node in closures:
+                    # Everything reachable from there is known already
+                    result |= closures[node]
+                else:
+                    stack.append(node)
+        closures[name] = frozenset(result)
+        return closures[name]
+
+    def depends(self, addon_names: Iterable[str], transitive: bool = False) -> set[str]:
+        """Return the dependencies of the given addons.
+
+        The given addons themselves are only part of the result if they are a
+        dependency of another one.
+        """
+        result: set[str] = set()
+        for name in addon_names:
+            if transitive:
+                result |= self._closure(name, self.depends_map, self._depends_closures)
+            else:
+                result |= self.depends_map.get(name, frozenset())
+        return result
+
+    def codepends(
+        self, addon_names: Iterable[str], transitive: bool = True
+    ) -> set[str]:
+        """Return the co-dependencies of the given addons.
+
+        These are the addons that depend on them. The given addons themselves
+        are only part of the result if they depend on another one.
+        """
+        result: set[str] = set()
+        for name in addon_names:
+            if transitive:
+                result |= self._closure(
+                    name, self.codepends_map, self._codepends_closures
+                )
+            else:
+                result |= self.codepends_map.get(name, frozenset())
+        return result
+
+    @cached_property
+    def topological_order(self) -> list[str]:
+        """The addons of the set, each one after all of its dependencies.
+
+        Ties are broken alphabetically so that the order is stable. Addons
+        that are part of a dependency cycle come last.
+        """
+        pending = {
+            name: len(depends & self.depends_map.keys())
+            for name, depends in self.depends_map.items()
+        }
+        ready = [name for name, count in pending.items() if not count]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            name = heapq.heappop(ready)
+            order.append(name)
+            del pending[name]
+            for codepend in self.codepends_map.get(name, ()):
+                pending[codepend] -= 1
+                if not pending[codepend]:
+                    heapq.heappush(ready, codepend)
+        return order + sorted(pending)
 
 
 def get_local_addons_selection() -> AddonsSelection:
@@ -60,6 +381,50 @@ def get_addons_selection(addon_names: Iterable[str]) -> AddonsSelection:
     return selection
 
 
+def get_changed_addons(
+    changed_paths: Iterable[Path], addons_set: AddonsSet
+) -> set[str]:
+    """Return the names of the addons owning the given changed paths.
+
+    Paths are relative to the project root. A file belongs to the closest
+    Odoo module it is located in, if any: changes outside of the addons set
+    (or in a module that is not part of it, e.g: not installable) are
+    ignored. A changed directory holding addons, like a submodule whose
+    commit changed, impacts all of them.
+    """
+    root = root_path()
+    addon_names_by_path = {addon.path: name for name, addon in addons_set.items()}
+    # Directory -> owning module path, shared by all the files of a module
+    owners: dict[Path, Path | None] = {}
+
+    def find_owner(path: Path) -> Path | None:
+        if path in owners:
+            return owners[path]
+        if path == root or path.parent == path:
+            owner = None
+        elif path in addon_names_by_path or is_odoo_module(path):
+            owner = path
+        else:
+            owner = find_owner(path.parent)
+        owners[path] = owner
+        return owner
+
+    changed = set()
+    for changed_path in changed_paths:
+        path = root / changed_path
+        owner = find_owner(path)
+        if owner is not None:
+            if owner in addon_names_by_path:
+                changed.add(addon_names_by_path[owner])
+        elif path.is_dir():
+            changed.update(
+                name
+                for addon_path, name in addon_names_by_path.items()
+                if addon_path.is_relative_to(path)
+            )
+    return changed
+
+
 def list_addons(
     selection: AddonsSelection,
     addons_set: AddonsSet,
@@ -81,15 +446,15 @@ def list_depends(
     item holds the addons that were not found in the addons directories.
     Missing addons raise an error, unless ``ignore_missing`` is set.
     """
-    addon_names, missing = list_depends_command(
-        selection,
-        addons_set,
-        transitive=transitive,
-        include_selected=include_selected,
-    )
+    depends = DependencyGraph(addons_set).depends(selection, transitive=transitive)
+    if transitive:
+        missing = sorted((depends | selection) - addons_set.keys())
+    else:
+        missing = sorted(selection - addons_set.keys())
     if missing and not ignore_missing:
-        ui.exit_msg(f"Addon(s) not found: {', '.join(sorted(missing))}")
-    return list(addon_names), sorted(missing)
+        ui.exit_msg(f"Addon(s) not found: {', '.join(missing)}")
+    addon_names = depends | selection if include_selected else depends - selection
+    return sorted(addon_names), missing
 
 
 def list_codepends(
@@ -111,12 +476,9 @@ def list_codepends(
     missing = sorted(selection - addons_set.keys())
     if missing and not ignore_missing:
         ui.exit_msg(f"Addon(s) not found: {', '.join(missing)}")
-    addon_names = list(
-        list_codepends_command(
-            selection,
-            addons_set,
-            transitive=transitive,
-            include_selected=include_selected,
-        )
-    )
-    return addon_names, missing
+    codepends = DependencyGraph(addons_set).codepends(selection, transitive=transitive)
+    if include_selected:
+        addon_names = codepends | selection
+    else:
+        addon_names = codepends - selection
+    return sorted(addon_names), missing
@@ -2,6 +2,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
 import os
+import shutil
 from contextlib import contextmanager
 from pathlib import Path
 
@@ -63,6 +64,27 @@ def cd(path):
         os.chdir(prev)
 
 
+@contextmanager
+def atomic_output(path):
+    """Yield a temporary path to write ``path`` to, moved in place on success.
+
+    The temporary path lives in the same directory, so that it's renamed
+    without being copied, and readers never see a partially written ``path``.
+    It can be either a file or a directory. It's removed on failure.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        yield tmp_path
+        tmp_path.replace(path)
+    except BaseException:
+        if tmp_path.is_dir():
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        else:
+            tmp_path.unlink(missing_ok=True)
+        raise
+
+
 def is_odoo_module(path: Path) -> bool:
     """Check if a path is a valid Odoo module."""
     return path.is_dir() and (
@@ -4,7 +4,11 @@
 import pytest
 from click.testing import CliRunner
 
+from odoo_tools.utils import db_template
 from odoo_tools.utils.config import config
+from odoo_tools.utils.db import get_connection_manager
+from odoo_tools.utils.docker_compose import get_version
+from odoo_tools.utils.manifestoo import get_addons_index
 from odoo_tools.utils.proj import get_project_manifest
 
 from .common import make_fake_project_root
@@ -72,6 +76,15 @@ def all_template_versions(project):
 @pytest.fixture(autouse=True)
 def clear_caches():
     get_project_manifest.cache_clear()
+    get_addons_index.cache_clear()
+    get_connection_manager.cache_clear()
+    get_version.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def dump_hashes_cache(tmp_path, monkeypatch):
+    """Keep the hashes of the dumps of the tests out of the user's cache"""
+    monkeypatch.setattr(db_template, "get_cache_path", lambda: tmp_path / "cache")
 
 
 @pytest.fixture(autouse=True)
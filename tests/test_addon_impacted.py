@@ -0,0 +1,75 @@
+# Copyright 2026 Camptocamp SA (https://www.camptocamp.com).
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from pathlib import Path
+from unittest import mock
+
+import git
+import pytest
+
+from odoo_tools.cli import addon
+from odoo_tools.utils.config import config
+
+from .common import make_fake_addon
+
+
+@pytest.fixture()
+def project_addons(project):
+    """A fake git project with a small addon dependency tree."""
+    make_fake_addon(config.odoo_src_rel_path / "odoo" / "addons" / "base")
+    make_fake_addon(config.ext_src_rel_path / "some_repo" / "oca_addon")
+    make_fake_addon(
+        config.local_src_rel_path / "my_addon", depends=["oca_addon", "base"]
+    )
+    make_fake_addon(config.local_src_rel_path / "other_addon", depends=["my_addon"])
+    make_fake_addon(config.local_src_rel_path / "lonely_addon", depends=["base"])
+    make_fake_addon(config.local_src_rel_path / "wip_addon", installable=False)
+    repo = git.Repo.init(".")
+    with repo.config_writer() as cfg:
+        cfg.set_value("user", "email", "test@test.com")
+        cfg.set_value("user", "name", "Test")
+        cfg.set_value("commit", "gpgsign", "false")
+    repo.index.add(repo.untracked_files)
+    repo.index.commit("initial commit")
+    return project
+
+
+def test_impacted_uncommitted(project_addons):
+    Path(config.local_src_rel_path / "my_addon" / "models.py").write_text("# new")
+    result = project_addons.invoke(addon.impacted)
+    assert result.exit_code == 0
+    assert result.output.splitlines() == ["my_addon", "other_addon"]
+
+
+def test_impacted_rev_range(project_addons):
+    repo = git.Repo(".")
+    manifest_path = config.ext_src_rel_path / "some_repo" / "oca_addon" / "README.md"
+    manifest_path.write_text("Changed")
+    Path("README.md").write_text("Not in any addon")
+    repo.index.add([str(manifest_path), "README.md"])
+    repo.index.commit("change oca_addon")
+    # Uncommitted changes are not part of the range
+    Path(config.local_src_rel_path / "lonely_addon" / "models.py").write_text("#")
+    result = project_addons.invoke(addon.impacted, "HEAD~1..HEAD --separator ,")
+    assert result.exit_code == 0
+    assert result.output.splitlines() == ["my_addon,oca_addon,other_addon"]
+
+
+def test_impacted_ignores_uninstallable(project_addons):
+    Path(config.local_src_rel_path / "wip_addon" / "models.py").write_text("# new")
+    result = project_addons.invoke(addon.impacted)
+    assert result.exit_code == 0
+    assert result.output == ""
+
+
+def test_impacted_changed_submodule(project_addons):
+    # A submodule whose commit changed is reported as its path by git
+    submodule_path = config.ext_src_rel_path / "new_repo"
+    make_fake_addon(submodule_path / "new_addon")
+    make_fake_addon(submodule_path / "new_addon_ext", depends=["new_addon"])
+    with mock.patch.object(
+        addon.git_utils, "get_changed_files", return_value=[submodule_path]
+    ):
+        result = project_addons.invoke(addon.impacted, "HEAD~1..HEAD")
+    assert result.exit_code == 0
+    assert result.output.splitlines() == ["new_addon", "new_addon_ext"]
@@ -69,3 +69,62 @@ def test_where_directory_without_manifest(project):
     result = project.invoke(addon.where, "not_an_addon")
     assert result.exit_code != 0
     assert "not found" in result.output.lower()
+
+
+def test_where_several_names(project):
+    make_fake_addon(config.local_src_rel_path / "my_addon")
+    make_fake_addon(config.ext_src_rel_path / "some_repo" / "other_addon")
+    result = project.invoke(addon.where, "my_addon other_addon")
+    assert result.exit_code == 0
+    lines = result.output.strip().splitlines()
+    assert len(lines) == 2
+    assert str(config.local_src_rel_path / "my_addon") in lines[0]
+    assert str(config.ext_src_rel_path / "some_repo" / "other_addon") in lines[1]
+
+
+def test_where_several_names_some_missing(project):
+    make_fake_addon(config.local_src_rel_path / "my_addon")
+    result = project.invoke(addon.where, "my_addon nope other_nope")
+    assert result.exit_code != 0
+    assert str(config.local_src_rel_path / "my_addon") in result.output
+    assert "Addon(s) not found: nope, other_nope" in result.output
+
+
+def test_where_glob(project):
+    make_fake_addon(config.local_src_rel_path / "sale_custom")
+    make_fake_addon(config.odoo_src_rel_path / "addons" / "sale")
+    make_fake_addon(config.odoo_src_rel_path / "addons" / "sale_stock")
+    make_fake_addon(config.odoo_src_rel_path / "addons" / "stock")
+    result = project.invoke(addon.where, ["sale_*"])
+    assert result.exit_code == 0
+    lines = result.output.strip().splitlines()
+    assert len(lines) == 2
+    assert str(config.local_src_rel_path / "sale_custom") in lines[0]
+    assert str(config.odoo_src_rel_path / "addons" / "sale_stock") in lines[1]
+
+
+def test_where_duplicates(project):
+    make_fake_addon(config.local_src_rel_path / "my_addon")
+    make_fake_addon(config.ext_src_rel_path / "some_repo" / "my_addon")
+    make_fake_addon(config.ext_src_rel_path / "some_repo" / "other_addon")
+    make_fake_addon(config.odoo_src_rel_path / "addons" / "other_addon")
+    make_fake_addon(config.odoo_src_rel_path / "addons" / "sale")
+    result = project.invoke(addon.where, "--duplicates")
+    assert result.exit_code == 0
+    lines = result.output.strip().splitlines()
+    assert len(lines) == 6
+    assert lines[0] == "my_addon"
+    assert str(config.local_src_rel_path / "my_addon") in lines[1]
+    assert str(config.ext_src_rel_path / "some_repo" / "my_addon") in lines[2]
+    assert lines[3] == "other_addon"
+    # Restricted to the given names
+    result = project.invoke(addon.where, "--duplicates other_addon sale")
+    assert result.exit_code == 0
+    assert result.output.strip().splitlines()[0] == "other_addon"
+    assert len(result.output.strip().splitlines()) == 3
+
+
+def test_where_no_name(project):
+    result = project.invoke(addon.where)
+    assert result.exit_code != 0
+    assert "Missing addon name(s)" in result.output
@@ -0,0 +1,97 @@
+# Copyright 2025 Camptocamp SA (https://www.camptocamp.com).
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+import os
+import subprocess
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from odoo_tools.cli.db import cli
+
+from .common import MockSubprocessRun
+
+DOCKER_COMPOSE_VERSION_CALL = {
+    "args": ["docker", "compose", "version", "--short"],
+    "stdout": b"2.36.2",
+}
+
+
+@pytest.mark.project_setup(manifest={"odoo_version": "16.0"})
+class TestDump:
+    def test_directory_format(self, project):
+        mock_fn = MockSubprocessRun(
+            [
+                DOCKER_COMPOSE_VERSION_CALL,
+                {
+                    "args": [
+                        "docker",
+                        "compose",
+                        "run",
+                        "--rm",
+                        "-T",
+                        "--quiet",
+                        "-v",
+                        f"{Path('dumps').absolute()}:/tmp/otools_db",
+                        "odoo",
+                        "pg_dump",
+                        "--format",
+                        "d",
+                        "--file",
+                        f"/tmp/otools_db/.prod.{os.getpid()}.tmp",
+                        "--jobs",
+                        "4",
+                        "--compress",
+                        "zstd:3",
+                        "odoodb",
+                    ],
+                    "sim_call": lambda: Path(f"dumps/.prod.{os.getpid()}.tmp").mkdir(),
+                },
+            ]
+        )
+        with patch("subprocess.run", mock_fn):
+            result = project.invoke(
+                cli,
+                [
+                    "dump",
+                    "odoodb",
+                    "dumps/prod",
+                    "--format",
+                    "d",
+                    "--jobs",
+                    "4",
+                    "--compress",
+                    "zstd:3",
+                ],
+            )
+        assert result.exit_code == 0, result.output
+        mock_fn.assert_completed_calls()
+        assert "Dump successfully generated at dumps/prod" in result.output
+        assert Path("dumps/prod").is_dir()
+        assert not [p for p in Path("dumps").iterdir() if p.name != "prod"]
+
+    def test_jobs_needs_directory_format(self, project):
+        result = project.invoke(cli, ["dump", "--jobs", "4"])
+        assert result.exit_code != 0
+        assert "--jobs is only supported with --format d" in result.output
+
+    @pytest.mark.parametrize("compress", ["bzip2", "zstd:high", "12"])
+    def test_invalid_compress(self, project, compress):
+        result = project.invoke(cli, ["dump", "--compress", compress])
+        assert result.exit_code == 2
+        assert "Invalid value for '--compress'" in result.output
+
+    def test_failed_dump_leaves_no_output(self, project):
+        def pg_dump():
+            Path(f".prod.pg.{os.getpid()}.tmp").write_bytes(b"PGDMP")
+            raise subprocess.CalledProcessError(1, "pg_dump")
+
+        mock_fn = MockSubprocessRun(
+            [DOCKER_COMPOSE_VERSION_CALL, {"args": None, "sim_call": pg_dump}]
+        )
+        with patch("subprocess.run", mock_fn):
+            result = project.invoke(cli, ["dump", "odoodb", "prod.pg"])
+        assert result.exit_code != 0
+        assert not Path("prod.pg").exists()
+        assert not Path(f".prod.pg.{os.getpid()}.tmp").exists()
@@ -0,0 +1,225 @@
+# Copyright 2025 Camptocamp SA (https://www.camptocamp.com).
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+import json
+import os
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from odoo_tools.cli.db import cli
+from odoo_tools.utils import db_template
+
+
+def make_row(name, size, dump=None, last_used=None):
+    comment = None
+    if dump:
+        comment = json.dumps(
+            {
+                "dump": dump,
+                "created": "2025-01-01T10:00:00",
+                "last_used": last_used,
+            }
+        )
+    return (name, size, comment)
+
+
+FAKE_TEMPLATES = [
+    make_row("otools_tpl_aaa", 10, "old.pg", "2025-01-02T10:00:00"),
+    make_row("otools_tpl_bbb", 20, "new.pg", "2025-03-01T10:00:00"),
+    make_row("otools_tpl_ccc", 5),  # interrupted restore
+    make_row("otools_tpl_ddd", 30, "mid.pg", "2025-02-01T10:00:00"),
+]
+
+
+@pytest.fixture(autouse=True)
+def creating():
+    """Templates being created by other processes"""
+    creating = set()
+
+    @contextmanager
+    def creation_lock(name, wait=True):
+        yield name not in creating
+
+    with patch("odoo_tools.utils.db_template._creation_lock", creation_lock):
+        yield creating
+
+
+@pytest.mark.parametrize(
+    "size,expected",
+    [("512", 512), ("1K", 1024), ("1.5G", 1.5 * 1024**3), ("20GiB", 20 * 1024**3)],
+)
+def test_parse_size(size, expected):
+    assert db_template.parse_size(size) == expected
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError):
+        db_template.parse_size("lots")
+
+
+def test_get_dump_hash(tmp_path):
+    dump_path = tmp_path / "prod.pg"
+    dump_path.write_bytes(b"PGDMP-middle-end")
+    dump_hash = db_template.get_dump_hash(dump_path)
+    # The whole dump is hashed
+    mtime_ns = dump_path.stat().st_mtime_ns
+    dump_path.write_bytes(b"PGDMP-MIDDLE-end")
+    # Whatever the resolution of the file system timestamps
+    os.utime(dump_path, ns=(mtime_ns + 1, mtime_ns + 1))
+    changed = db_template.get_dump_hash(dump_path)
+    assert changed != dump_hash
+    # But not its name
+    dump_path = dump_path.rename(tmp_path / "prod-copy.pg")
+    assert db_template.get_dump_hash(dump_path) == changed
+    # Directory format dumps
+    (tmp_path / "prod").mkdir()
+    (tmp_path / "prod" / "toc.dat").write_bytes(b"PGDMP")
+    assert db_template.get_dump_hash(tmp_path / "prod") != changed
+
+
+def test_get_dump_hash_cache(tmp_path):
+    dump_path = tmp_path / "prod.pg"
+    dump_path.write_bytes(b"PGDMP")
+    dump_hash = db_template.get_dump_hash(dump_path)
+    # Unchanged files aren't read again
+    with patch.object(Path, "open", autospec=True, side_effect=Path.open) as opened:
+        assert db_template.get_dump_hash(dump_path) == dump_hash
+    assert dump_path not in [call.args[0] for call in opened.call_args_list]
+    # Changed ones are
+    dump_path.write_bytes(b"PGDMP-changed")
+    assert db_template.get_dump_hash(dump_path) != dump_hash
+
+
+def test_list_templates():
+    with patch("odoo_tools.utils.db.execute_db_request", return_value=FAKE_TEMPLATES):
+        templates = db_template.list_templates()
+    # The least recently used first
+    assert [t.name for t in templates] == [
+        "otools_tpl_ccc",
+        "otools_tpl_aaa",
+        "otools_tpl_ddd",
+        "otools_tpl_bbb",
+    ]
+    assert not templates[0].complete
+    assert templates[1].dump == "old.pg"
+
+
+@pytest.mark.parametrize(
+    "budget,keep,expected",
+    [
+        # Incomplete templates are always dropped
+        (100, [], ["otools_tpl_ccc"]),
+        (50, [], ["otools_tpl_ccc", "otools_tpl_aaa"]),
+        (20, [], ["otools_tpl_ccc", "otools_tpl_aaa", "otools_tpl_ddd"]),
+        (30, ["otools_tpl_aaa"], ["otools_tpl_ccc", "otools_tpl_ddd"]),
+    ],
+)
+def test_gc(budget, keep, expected):
+    with (
+        patch("odoo_tools.utils.db.execute_db_request", return_value=FAKE_TEMPLATES),
+        patch("odoo_tools.utils.db_template.drop_template") as drop_template,
+    ):
+        dropped = db_template.gc(budget, keep=keep)
+    assert [t.name for t in dropped] == expected
+    assert [c.args[0] for c in drop_template.call_args_list] == expected
+
+
+def test_gc_spares_templates_being_created(creating):
+    creating.add("otools_tpl_ccc")
+    with (
+        patch("odoo_tools.utils.db.execute_db_request", return_value=FAKE_TEMPLATES),
+        patch("odoo_tools.utils.db_template.drop_template") as drop_template,
+    ):
+        dropped = db_template.gc(100)
+    assert dropped == []
+    drop_template.assert_not_called()
+
+
+def test_create_db_from_pool_reuses_template(tmp_path):
+    dump_path = tmp_path / "prod.pg"
+    dump_path.write_bytes(b"PGDMP")
+    name = db_template.get_template_name(db_template.get_dump_hash(dump_path))
+    templates = [make_row(name, 10, "prod.pg", "2025-01-02T10:00:00")]
+    with (
+        patch("odoo_tools.utils.db.execute_db_request", return_value=templates),
+        patch("odoo_tools.utils.db.create_db_from_db_dump") as restore_dump,
+        patch("odoo_tools.utils.db.create_db_from_db_template") as clone_template,
+    ):
+        db_template.create_db_from_pool("pr_1", dump_path)
+    restore_dump.assert_not_called()
+    clone_template.assert_called_once_with("pr_1", name)
+
+
+def test_create_db_from_pool_creates_template(tmp_path):
+    dump_path = tmp_path / "prod.pg"
+    dump_path.write_bytes(b"PGDMP")
+    name = db_template.get_template_name(db_template.get_dump_hash(dump_path))
+    with (
+        patch("odoo_tools.utils.db.execute_db_request", return_value=[]) as execute,
+        patch("odoo_tools.utils.db.drop_database"),
+        patch("odoo_tools.utils.db.create_db_from_db_dump") as restore_dump,
+        patch("odoo_tools.utils.db.create_db_from_db_template") as clone_template,
+    ):
+        db_template.create_db_from_pool("pr_1", dump_path, jobs=2)
+    restore_dump.assert_called_once_with(name, dump_path, jobs=2, check=True)
+    clone_template.assert_called_once_with("pr_1", name)
+    metadata = json.loads(execute.call_args.args[2][0])
+    assert metadata["dump"] == "prod.pg"
+
+
+def test_create_db_from_pool_failed_restore(tmp_path):
+    dump_path = tmp_path / "prod.pg"
+    dump_path.write_bytes(b"PGDMP")
+    name = db_template.get_template_name(db_template.get_dump_hash(dump_path))
+    with (
+        patch("odoo_tools.utils.db.execute_db_request", return_value=[]) as execute,
+        patch("odoo_tools.utils.db.drop_database") as drop_database,
+        patch("odoo_tools.utils.db.create_db_from_db_dump") as restore_dump,
+        patch("odoo_tools.utils.db.create_db_from_db_template") as clone_template,
+    ):
+        restore_dump.side_effect = subprocess.CalledProcessError(1, "pg_restore")
+        with pytest.raises(subprocess.CalledProcessError):
+            db_template.create_db_from_pool("pr_1", dump_path)
+    # The partial restore doesn't become a template
+    assert drop_database.call_args_list[-1].args == (name,)
+    assert not any("IS_TEMPLATE" in str(c.args[1]) for c in execute.call_args_list)
+    clone_template.assert_not_called()
+
+
+def test_create_db_from_pool_interrupted_creation(tmp_path):
+    dump_path = tmp_path / "prod.pg"
+    dump_path.write_bytes(b"PGDMP")
+    name = db_template.get_template_name(db_template.get_dump_hash(dump_path))
+
+    def execute_db_request(dbname, query, params=None):
+        # Interrupted before its metadata was saved: flagged as a template,
+        # but incomplete
+        if "datistemplate" in str(query):
+            return [(1,)]
+        return []
+
+    with (
+        patch(
+            "odoo_tools.utils.db.execute_db_request", side_effect=execute_db_request
+        ) as execute,
+        patch("odoo_tools.utils.db.drop_database") as drop_database,
+        patch("odoo_tools.utils.db.create_db_from_db_dump"),
+        patch("odoo_tools.utils.db.create_db_from_db_template"),
+    ):
+        db_template.create_db_from_pool("pr_1", dump_path)
+    # It is unflagged before it is dropped
+    queries = [str(c.args[1]) for c in execute.call_args_list]
+    assert any("IS_TEMPLATE false" in query for query in queries)
+    drop_database.assert_called_once_with(name)
+
+
+@pytest.mark.project_setup(manifest={"odoo_version": "16.0"})
+def test_restore_template_pool_rejects_zip(project):
+    Path("backup.zip").touch()
+    result = project.invoke(cli, ["restore", "backup.zip", "--template-pool"])
+    assert result.exit_code != 0
+    assert "--template-pool can't be used" in result.output
@@ -0,0 +1,307 @@
+# Copyright 2025 Camptocamp SA (https://www.camptocamp.com).
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+import io
+import subprocess
+import sys
+import threading
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+from types import ModuleType
+from unittest.mock import ANY, MagicMock, patch
+
+import pytest
+
+from odoo_tools import utils
+from odoo_tools.cli import i18n
+from odoo_tools.cli.i18n import cli
+from odoo_tools.utils import manifestoo as manifestoo_utils
+from odoo_tools.utils.db_template import Template
+
+from .common import make_fake_addon
+
+
+@pytest.fixture
+def fake_odoo_shell(monkeypatch):
+    """Run the scripts given to ``odoo shell`` with a fake ``trans_export``"""
+    translate = ModuleType("odoo.tools.translate")
+
+    def trans_export(lang, modules, buffer, format, env):
+        buffer.write(f"{modules[0]}:{lang}:{format}".encode())
+
+    monkeypatch.setattr(translate, "trans_export", trans_export, raising=False)
+    monkeypatch.setitem(sys.modules, "odoo", ModuleType("odoo"))
+    monkeypatch.setitem(sys.modules, "odoo.tools", ModuleType("odoo.tools"))
+    monkeypatch.setitem(sys.modules, "odoo.tools.translate", translate)
+    commands = []
+    # redirect_stdout swaps sys.stdout, for all the threads
+    lock = threading.Lock()
+
+    def popen(command, **kwargs):
+        commands.append(command)
+        host_path, container_path = command[command.index("-v") + 1].split(":")
+        script = Path(host_path, Path(command[-1]).name).read_text()
+        stdout = io.StringIO()
+        with lock, redirect_stdout(stdout):
+            exec(script.replace(container_path, host_path), {"env": object()})
+        # The exported paths are printed as seen from the container
+        process = MagicMock(returncode=0)
+        process.__enter__.return_value = process
+        process.stdout = io.StringIO(
+            stdout.getvalue().replace(host_path, container_path)
+        )
+        return process
+
+    with (
+        patch("odoo_tools.utils.docker_compose.get_version", return_value=[2, 36]),
+        patch("subprocess.Popen", side_effect=popen),
+    ):
+        yield commands
+
+
+@pytest.mark.project_setup(manifest={"odoo_version": "16.0"})
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_export(project, fake_odoo_shell, jobs):
+    make_fake_addon("odoo/addons/module1")
+    make_fake_addon("odoo/addons/module2")
+    result = project.invoke(
+        cli,
+        [
+            "export",
+            "odoo/addons/module1",
+            "odoo/addons/module2",
+            "--languages",
+            "fr_FR,de_CH",
+            "--export-pot",
+            "--no-clean-db",
+            "--no-init-db",
+            "--jobs",
+            str(jobs),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    # A single odoo shell per worker
+    assert len(fake_odoo_shell) == jobs
+    assert all("odoo shell" in command[-3] for command in fake_odoo_shell)
+    # The files are listed in order, whatever the worker they're exported by
+    assert [line[2:] for line in result.output.splitlines() if "✅" in line] == [
+        "odoo/addons/module1/i18n/module1.pot",
+        "odoo/addons/module1/i18n/fr.po",
+        "odoo/addons/module1/i18n/de.po",
+        "odoo/addons/module2/i18n/module2.pot",
+        "odoo/addons/module2/i18n/fr.po",
+        "odoo/addons/module2/i18n/de.po",
+    ]
+    for module in ("module1", "module2"):
+        i18n_path = Path("odoo/addons", module, "i18n")
+        assert (i18n_path / f"{module}.pot").read_text() == f"{module}:None:po"
+        assert (i18n_path / "fr.po").read_text() == f"{module}:fr_FR:po"
+        assert (i18n_path / "de.po").read_text() == f"{module}:de_CH:po"
+
+
+@pytest.mark.project_setup(manifest={"odoo_version": "16.0"})
+def test_i18n_fingerprint(project):
+    make_fake_addon("odoo/addons/module1")
+    po_path = Path("odoo/addons/module1/i18n/fr.po")
+    po_path.parent.mkdir()
+    po_path.write_text('"PO-Revision-Date: 2025-01-01 10:00+0000\\n"\nmsgid "Hello"\n')
+    fingerprint = i18n._get_i18n_fingerprint(["odoo/addons/module1"], ["fr_FR"])
+    # The dates of the translation files are ignored
+    po_path.write_text('"PO-Revision-Date: 2025-02-01 10:00+0000\\n"\nmsgid "Hello"\n')
+    assert i18n._get_i18n_fingerprint(["odoo/addons/module1"], ["fr_FR"]) == fingerprint
+    # But not their terms, the languages, or the sources of the modules
+    po_path.write_text('"PO-Revision-Date: 2025-02-01 10:00+0000\\n"\nmsgid "Hi"\n')
+    changed = i18n._get_i18n_fingerprint(["odoo/addons/module1"], ["fr_FR"])
+    assert changed != fingerprint
+    assert i18n._get_i18n_fingerprint(["odoo/addons/module1"], ["de_DE"]) != changed
+    Path("odoo/addons/module1/models.py").write_text("# new model")
+    changed = i18n._get_i18n_fingerprint(["odoo/addons/module1"], ["fr_FR"])
+    assert changed != fingerprint
+    # The translation files of the other languages are ignored
+    Path("odoo/addons/module1/i18n/de.po").write_text('msgid "Hello"\n')
+    assert i18n._get_i18n_fingerprint(["odoo/addons/module1"], ["fr_FR"]) == changed
+    # Whatever the working directory
+    with utils.path.cd("odoo"):
+        assert i18n._get_i18n_fingerprint(["odoo/addons/module1"], ["fr_FR"]) == changed
+
+
+@pytest.mark.project_setup(manifest={"odoo_version": "16.0"})
+def test_i18n_fingerprint_dependencies(project):
+    make_fake_addon("odoo/local-src/module1", depends=["module2"])
+    make_fake_addon("odoo/local-src/module2", depends=["base", "web"])
+    make_fake_addon("odoo/src/odoo/addons/base")
+    fingerprint = i18n._get_i18n_fingerprint(["odoo/local-src/module1"], ["fr_FR"])
+    # The sources of the dependencies found in the project are part of it
+    for module_path in ("odoo/local-src/module2", "odoo/src/odoo/addons/base"):
+        Path(module_path, "models.py").write_text("# new model")
+        changed = i18n._get_i18n_fingerprint(["odoo/local-src/module1"], ["fr_FR"])
+        assert changed != fingerprint
+        fingerprint = changed
+    # But not the sources of the modules depending on them
+    make_fake_addon("odoo/local-src/module3", depends=["module1"])
+    manifestoo_utils.get_addons_index.cache_clear()
+    changed = i18n._get_i18n_fingerprint(["odoo/local-src/module1"], ["fr_FR"])
+    assert changed == fingerprint
+
+
+@pytest.mark.project_setup(manifest={"odoo_version": "16.0"})
+@pytest.mark.usefixtures("fake_odoo_shell")
+def test_export_clones_the_cached_db(project):
+    make_fake_addon("odoo/addons/module1")
+    fingerprint = i18n._get_i18n_fingerprint(["odoo/addons/module1"], ["fr_FR"])
+    now = datetime.now()
+    with (
+        patch("odoo_tools.utils.db.drop_database"),
+        patch("odoo_tools.utils.db_template.ensure_template") as ensure_template,
+        patch("odoo_tools.utils.db.create_db_from_db_template") as clone_template,
+        patch("odoo_tools.utils.db_template.list_templates") as list_templates,
+        patch("odoo_tools.utils.db_template.drop_template") as drop_template,
+    ):
+        ensure_template.return_value = Template(
+            "otools_tpl_i18n", 10, "i18n of module1 (fr_FR)", now, now
+        )
+        list_templates.return_value = [
+            ensure_template.return_value,
+            Template("otools_tpl_old", 10, "i18n of module1 (fr_FR)", now, now),
+            Template("otools_tpl_de", 10, "i18n of module1 (de_DE)", now, now),
+            Template("otools_tpl_prod", 10, "prod.pg", now, now),
+            # Being created by another process
+            Template("otools_tpl_new", 10),
+        ]
+        result = project.invoke(
+            cli, ["export", "odoo/addons/module1", "--languages", "fr_FR"]
+        )
+    assert result.exit_code == 0, result.output
+    assert ensure_template.call_args.args[0] == f"otools_tpl_{fingerprint[:16]}"
+    assert ensure_template.call_args.kwargs["source"] == "i18n of module1 (fr_FR)"
+    clone_template.assert_called_once_with("tmp_generate_pot", "otools_tpl_i18n")
+    # The translation databases of the same modules and languages initialized
+    # from previous sources are dropped
+    drop_template.assert_called_once_with("otools_tpl_old")
+
+
+@pytest.mark.project_setup(manifest={"odoo_version": "16.0"})
+def test_export_skips_unchanged_modules(project, fake_odoo_shell):
+    make_fake_addon("odoo/addons/module1")
+    make_fake_addon("odoo/addons/module2")
+    args = [
+        "export",
+        "odoo/addons/module1",
+        "odoo/addons/module2",
+        "--languages",
+        "fr_FR",
+        "--no-clean-db",
+        "--no-init-db",
+    ]
+    result = project.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert Path("odoo/addons/module1/i18n/.otools-i18n.json").is_file()
+    # Nothing changed: nothing to export
+    result = project.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "odoo/addons/module1/i18n/fr.po is up to date" in result.output
+    assert len(fake_odoo_shell) == 1
+    # Only the changed modules are exported again
+    Path("odoo/addons/module2/models.py").write_text("# new model")
+    result = project.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "✅ odoo/addons/module2/i18n/fr.po" in result.output
+    assert "✅ odoo/addons/module1/i18n/fr.po" not in result.output
+    # Unless forced to
+    result = project.invoke(cli, [*args, "--force"])
+    assert "✅ odoo/addons/module1/i18n/fr.po" in result.output
+    assert len(fake_odoo_shell) == 3
+
+
+@pytest.mark.project_setup(manifest={"odoo_version": "16.0"})
+@pytest.mark.usefixtures("fake_odoo_shell")
+def test_export_reuses_the_cached_db(project):
+    for module in ("module1", "module2"):
+        make_fake_addon(f"odoo/addons/{module}")
+        # As exported by the fake odoo shell, so that the export leaves the
+        # sources the translation database is initialized from unchanged
+        po_path = Path(f"odoo/addons/{module}/i18n/fr.po")
+        po_path.parent.mkdir()
+        po_path.write_text(f"{module}:fr_FR:po")
+    args = [
+        "export",
+        "odoo/addons/module1",
+        "odoo/addons/module2",
+        "--languages",
+        "fr_FR",
+    ]
+    with (
+        patch("odoo_tools.utils.db.drop_database"),
+        patch("odoo_tools.utils.db_template.ensure_template") as ensure_template,
+        patch("odoo_tools.utils.db.create_db_from_db_template"),
+        patch("odoo_tools.utils.db_template.list_templates", return_value=[]),
+        patch("odoo_tools.cli.i18n._init_db") as init_db,
+    ):
+        ensure_template.return_value.name = "otools_tpl_i18n"
+        result = project.invoke(cli, args)
+        assert result.exit_code == 0, result.output
+        # module2 was updated without exporting its translation files
+        Path("odoo/addons/module2/i18n/.otools-i18n.json").write_text("{}")
+        result = project.invoke(cli, args)
+        assert result.exit_code == 0, result.output
+        assert "✅ odoo/addons/module2/i18n/fr.po" in result.output
+        assert "✅ odoo/addons/module1/i18n/fr.po" not in result.output
+        first, second = ensure_template.call_args_list
+        assert first.args[0] == second.args[0]
+        # All the modules are installed, whatever the modules to export
+        second.kwargs["create"]("otools_tpl_i18n")
+    init_db.assert_called_once_with(
+        "otools_tpl_i18n", ["module1", "module2"], ["fr_FR"], ANY
+    )
+
+
+@pytest.mark.project_setup(manifest={"odoo_version": "16.0"})
+@pytest.mark.usefixtures("fake_odoo_shell")
+def test_export_moves_files_in_order(project):
+    make_fake_addon("odoo/addons/module1")
+    make_fake_addon("odoo/addons/module2")
+    moved = []
+    replace = Path.replace
+
+    def record_replace(source, target):
+        moved.append(Path(target).relative_to(Path.cwd()).as_posix())
+        return replace(source, target)
+
+    with patch.object(Path, "replace", record_replace):
+        result = project.invoke(
+            cli,
+            [
+                "export",
+                "odoo/addons/module1",
+                "odoo/addons/module2",
+                "--languages",
+                "fr_FR,de_CH",
+                "--no-clean-db",
+                "--no-init-db",
+                "--jobs",
+                "3",
+            ],
+        )
+    assert result.exit_code == 0, result.output
+    # Whatever the worker they're exported by
+    assert moved[:4] == [
+        "odoo/addons/module1/i18n/fr.po",
+        "odoo/addons/module1/i18n/de.po",
+        "odoo/addons/module2/i18n/fr.po",
+        "odoo/addons/module2/i18n/de.po",
+    ]
+
+
+def test_export_shard_failure(tmp_path, capsys):
+    process = MagicMock(returncode=1)
+    process.__enter__.return_value = process
+    process.stdout = io.StringIO("Traceback: no such database\n")
+    with (
+        patch("odoo_tools.utils.docker_compose.get_version", return_value=[2, 36]),
+        patch("subprocess.Popen", return_value=process),
+        pytest.raises(subprocess.CalledProcessError),
+    ):
+        i18n._export_shard([], tmp_path, "1000", lambda path: None)
+    # The output of the odoo shell tells why
+    assert capsys.readouterr().err == "Traceback: no such database\n"
@@ -0,0 +1,221 @@
+# Copyright 2025 Camptocamp SA (https://www.camptocamp.com).
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+import threading
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+
+import click
+import pytest
+from psycopg2 import sql
+
+from odoo_tools.cli import migrate_db
+from odoo_tools.cli.migrate_db import MigrationState, Step
+
+
+class FakeSteps:
+    """A restore, a dump of the restored DB, and an unrelated step"""
+
+    def __init__(self, path):
+        self.path = path
+        self.params = {"dump": "v1"}
+        self.calls = []
+        self.failing = set()
+        self.steps = [
+            Step(
+                "restore",
+                lambda: self.run("restore", "restored"),
+                inputs=lambda: dict(self.params),
+                outputs=lambda: [("file", str(path / "restored"))],
+            ),
+            Step(
+                "dump",
+                lambda: self.run("dump", "dump.pg"),
+                requires=("restore",),
+                outputs=lambda: [("file", str(path / "dump.pg"))],
+            ),
+            Step("other", lambda: self.run("other"), after=("restore",)),
+        ]
+
+    def run(self, name, output=None):
+        self.calls.append(name)
+        if name in self.failing:
+            raise SystemExit(f"{name} failed")
+        if output:
+            (self.path / output).write_text(self.params["dump"])
+        return {f"{name}_value": True}
+
+    def run_steps(self, restart_steps=()):
+        ctx = click.Context(migrate_db.cli, obj={})
+        with ctx:
+            migrate_db._run_steps(
+                self.steps, MigrationState(self.path / "state.json"), set(restart_steps)
+            )
+        return ctx.obj
+
+
+def test_run_steps_resume(tmp_path):
+    fake = FakeSteps(tmp_path)
+    obj = fake.run_steps()
+    assert sorted(fake.calls) == ["dump", "other", "restore"]
+    assert obj["restore_value"]
+    state = MigrationState(tmp_path / "state.json")
+    assert state.get("dump")["status"] == "done"
+    # Everything is done: the steps are skipped, their values are restored
+    fake.calls.clear()
+    obj = fake.run_steps()
+    assert fake.calls == []
+    assert obj["restore_value"]
+    # A changed input re-runs the step, and the ones using its outputs
+    fake.params["dump"] = "v2"
+    fake.run_steps()
+    assert fake.calls == ["restore", "dump"]
+    # As well as a removed output
+    fake.calls.clear()
+    (tmp_path / "dump.pg").unlink()
+    fake.run_steps()
+    assert fake.calls == ["dump"]
+    # Or a restarted step
+    fake.calls.clear()
+    fake.run_steps(restart_steps=["restore"])
+    assert fake.calls == ["restore", "dump"]
+
+
+def test_run_steps_failure(tmp_path):
+    fake = FakeSteps(tmp_path)
+    fake.failing.add("dump")
+    with pytest.raises(SystemExit, match="dump failed"):
+        fake.run_steps()
+    state = MigrationState(tmp_path / "state.json")
+    assert state.get("restore")["status"] == "done"
+    assert state.get("dump")["status"] == "failed"
+    # The next run resumes from the failed step
+    fake.calls.clear()
+    fake.failing.clear()
+    fake.run_steps()
+    assert fake.calls == ["dump"]
+
+
+def test_run_steps_after_released(tmp_path):
+    dumped = threading.Event()
+
+    def migrate():
+        migrate_db._release_inputs()
+        # The dump runs along, once the inputs are released
+        assert dumped.wait(timeout=5)
+
+    steps = [
+        Step("migrate", migrate),
+        Step("dump", dumped.set, after=("migrate",)),
+    ]
+    ctx = click.Context(migrate_db.cli, obj={})
+    with ctx:
+        migrate_db._run_steps(steps, MigrationState(tmp_path / "state.json"), set())
+    state = MigrationState(tmp_path / "state.json")
+    assert state.get("migrate")["status"] == "done"
+    assert state.get("dump")["status"] == "done"
+
+
+@pytest.mark.parametrize(
+    "dump_format,expected",
+    [("c", "pg_dump -b -Fc -d db -f"), ("d", "pg_dump -b -Fd -j 4 -d db -f")],
+)
+def test_dump_db(tmp_path, dump_format, expected):
+    ctx = click.Context(
+        migrate_db.cli,
+        obj={"store_path": tmp_path, "container_store_path": tmp_path, "jobs": 4},
+    )
+    (tmp_path / "dump").mkdir()
+    with ctx, patch.object(migrate_db, "_run_docker_compose_cmd") as run:
+        run.side_effect = lambda cmd: Path(cmd.split()[-1]).mkdir()
+        migrate_db._dump_db("db", tmp_path / "dump", format=dump_format)
+    assert expected in run.call_args.args[0]
+    # The dump of the previous run is replaced
+    assert (tmp_path / "dump").is_dir()
+    assert [path.name for path in tmp_path.iterdir()] == ["dump"]
+
+
+def test_restore_odoo_migrated_streams_the_dump(tmp_path):
+    with zipfile.ZipFile(tmp_path / "upgraded.zip", "w") as upgraded:
+        upgraded.writestr("dump.sql", "CREATE TABLE foo ();\n")
+        upgraded.writestr("filestore/ab/abcdef", "attachment")
+    ctx = click.Context(
+        migrate_db.cli,
+        obj={
+            "db_odoo_migrated": "db_odoo_migrated",
+            "store_path": tmp_path,
+            "project_path": tmp_path,
+        },
+    )
+    with (
+        ctx,
+        patch.object(migrate_db, "_dropdb"),
+        patch.object(migrate_db, "_createdb"),
+        patch("subprocess.Popen") as popen,
+    ):
+        migrate_db.restore_odoo_migrated()
+    assert "psql -d db_odoo_migrated" in popen.call_args.args[0]
+    stdin = popen.return_value.__enter__.return_value.stdin
+    streamed = b"".join(call.args[0] for call in stdin.write.call_args_list)
+    assert streamed == b"CREATE TABLE foo ();\n"
+    # Nothing is extracted
+    assert [path.name for path in tmp_path.iterdir()] == ["upgraded.zip"]
+
+
+def test_db_existence_checks_share_a_connection(tmp_path):
+    ctx = click.Context(migrate_db.cli, obj={"db_port": "5433"})
+    step = Step(
+        "clone",
+        lambda: None,
+        outputs=lambda: [("db", "db_core"), ("db", "db_local")],
+    )
+    record = {"outputs": {"db:db_core": None, "db:db_local": None}}
+    with ctx, patch("psycopg2.connect") as connect:
+        connect.return_value.closed = 0
+        cursor = connect.return_value.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [("db_core",), ("db_local",)]
+        assert migrate_db._check_outputs(step, record)
+        cursor.fetchall.return_value = [("db_core",)]
+        assert not migrate_db._check_outputs(step, record)
+        assert migrate_db._db_exists("db_core")
+    connect.assert_called_once_with(
+        host="localhost", dbname="postgres", user="odoo", password="odoo", port="5433"
+    )
+    # A query for all the databases, whose names are passed as parameters
+    assert cursor.execute.call_count == 3
+    sql, params = cursor.execute.call_args_list[0].args
+    assert "ANY(%s)" in sql
+    assert sorted(params[0]) == ["db_core", "db_local"]
+    # The connection is closed with the command
+    connect.return_value.close.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "server_version,options",
+    [
+        (120000, ("", "")),
+        (130000, (" WITH (FORCE)", "")),
+        (150000, (" WITH (FORCE)", " STRATEGY FILE_COPY")),
+    ],
+)
+def test_dropdb_createdb(server_version, options):
+    ctx = click.Context(migrate_db.cli, obj={"db_port": "5433"})
+    with ctx, patch("psycopg2.connect") as connect:
+        connect.return_value.closed = 0
+        connect.return_value.server_version = server_version
+        cursor = connect.return_value.cursor.return_value.__enter__.return_value
+        migrate_db._dropdb("db_core")
+        migrate_db._createdb("db_core", db_template="db_migrated")
+    drop, create = (call.args[0] for call in cursor.execute.call_args_list)
+    force, file_copy = options
+    expected_drop = sql.SQL("DROP DATABASE IF EXISTS {}").format(
+        sql.Identifier("db_core")
+    )
+    expected_create = sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(
+        sql.Identifier("db_core"), sql.Identifier("db_migrated")
+    )
+    assert drop == (expected_drop + sql.SQL(force) if force else expected_drop)
+    assert create == (
+        expected_create + sql.SQL(file_copy) if file_copy else expected_create
+    )
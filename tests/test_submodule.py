@@ -1,3 +1,4 @@
+import ast
 from pathlib import Path
 from unittest import mock
 
@@ -5,7 +6,27 @@ import pytest
 
 from odoo_tools.cli import submodule
 
-from .common import MockSubprocessRun, get_fixture_path, mock_pending_merge_repo_paths
+from .common import (
+    MockSubprocessRun,
+    get_fixture_path,
+    make_fake_addon,
+    mock_pending_merge_repo_paths,
+)
+
+FAKE_GITMODULES_UNSORTED = """
+[submodule "odoo/external-src/server-tools"]
+	path = odoo/external-src/server-tools
+	url = git@github.com:OCA/server-tools.git
+[submodule "odoo/external-src/empty-repo"]
+	path = odoo/external-src/empty-repo
+	url = git@github.com:OCA/empty-repo.git
+[submodule "odoo/external-src/account-closing"]
+	path = odoo/external-src/account-closing
+	url = git@github.com:OCA/account-closing.git
+[submodule "odoo/external-src/not-cloned"]
+	path = odoo/external-src/not-cloned
+	url = git@github.com:OCA/not-cloned.git
+"""
 
 
 @pytest.mark.project_setup(
@@ -310,6 +331,107 @@ def test_ls_dockerfile_v2(project):
     ]
 
 
+@pytest.mark.project_setup(
+    manifest=dict(odoo_version="16.0"),
+    proj_version="16.0.1.2.3",
+    extra_files={
+        ".gitmodules": FAKE_GITMODULES_UNSORTED,
+    },
+)
+@pytest.mark.parametrize(
+    "options, expected_submodules",
+    [
+        (
+            ["--optimize"],
+            # In order, the submodules that are not checked out being kept
+            [
+                "/odoo/external-src/server-tools",
+                "/odoo/external-src/account-closing",
+                "/odoo/external-src/not-cloned",
+            ],
+        ),
+        (
+            ["--only-needed"],
+            ["/odoo/external-src/account-closing", "/odoo/external-src/not-cloned"],
+        ),
+    ],
+)
+def test_ls_dockerfile_optimize(project, options, expected_submodules):
+    ext_src = Path("odoo/external-src")
+    make_fake_addon("odoo/src/odoo/addons/base")
+    make_fake_addon("odoo/src/addons/account", depends=["base"])
+    make_fake_addon("odoo/local-src/my_addon", depends=["account_closing"])
+    make_fake_addon(ext_src / "account-closing/account_closing", depends=["account"])
+    make_fake_addon(ext_src / "account-closing/account", depends=["base"])
+    make_fake_addon(ext_src / "server-tools/base_unused", depends=["base"])
+    make_fake_addon(ext_src / "empty-repo/wip_addon", installable=False)
+    (ext_src / "empty-repo/README.md").touch()
+    result = project.invoke(
+        submodule.ls,
+        ["--dockerfile", *options],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    assert result.stdout.splitlines() == [
+        'ENV ADDONS_PATH="/odoo/src/odoo/addons, \\',
+        "/odoo/src/addons, \\",
+        "/odoo/local-src, \\",
+        *(f"{line}, \\" for line in expected_submodules[:-1]),
+        f'{expected_submodules[-1]}" \\',
+        "",
+    ]
+    dropped = 4 - len(expected_submodules)
+    assert f"Dropped {dropped} addons path(s)" in result.stderr
+    assert "- /odoo/external-src/empty-repo" in result.stderr
+    assert (
+        "account is loaded from /odoo/src/addons, "
+        "shadowing /odoo/external-src/account-closing"
+    ) in result.stderr
+
+
+@pytest.mark.project_setup(
+    manifest=dict(odoo_version="16.0"),
+    proj_version="16.0.1.2.3",
+    extra_files={
+        ".gitmodules": FAKE_GITMODULES_UNSORTED,
+        "odoo/migration.yml": (
+            "migration:\n"
+            "  versions:\n"
+            "    - version: setup\n"
+            "      addons:\n"
+            "        upgrade:\n"
+            "          - base_setup_tools\n"
+        ),
+        "requirements.txt": "odoo-addon-account_closing == 16.0.1.0.0\nrequests\n",
+    },
+)
+def test_ls_dockerfile_only_needed_installed_addons(project):
+    ext_src = Path("odoo/external-src")
+    make_fake_addon("odoo/src/odoo/addons/base")
+    make_fake_addon("odoo/local-src/my_addon", depends=["base"])
+    # Installed by the migration file, and from the requirements
+    make_fake_addon(ext_src / "server-tools/base_setup_tools", depends=["base"])
+    make_fake_addon(ext_src / "account-closing/account_closing", depends=["base"])
+    # Installed along with its dependencies
+    make_fake_addon(ext_src / "empty-repo/auto_glue", depends=["my_addon"])
+    manifest_path = ext_src / "empty-repo/auto_glue/__manifest__.py"
+    manifest = ast.literal_eval(manifest_path.read_text())
+    manifest_path.write_text(repr({**manifest, "auto_install": True}))
+    result = project.invoke(
+        submodule.ls,
+        ["--dockerfile", "--only-needed"],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    assert "Dropped 0 addons path(s)" in result.stderr
+    assert result.stdout.splitlines()[3:7] == [
+        "/odoo/external-src/server-tools, \\",
+        "/odoo/external-src/empty-repo, \\",
+        "/odoo/external-src/account-closing, \\",
+        '/odoo/external-src/not-cloned" \\',
+    ]
+
+
 @pytest.mark.project_setup(
     manifest=dict(odoo_version="16.0"),
     proj_version="16.0.1.2.3",
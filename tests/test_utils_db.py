@@ -0,0 +1,294 @@
+# Copyright 2025 Camptocamp SA (https://www.camptocamp.com).
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+import io
+import tarfile
+import zipfile
+from configparser import ConfigParser
+from datetime import datetime
+from unittest.mock import patch
+
+import psycopg2
+import pytest
+from psycopg2 import sql
+
+from odoo_tools.exceptions import Exit
+from odoo_tools.utils import db
+
+
+class FakeStdin(io.BytesIO):
+    def close(self):
+        self.data = self.getvalue()
+        super().close()
+
+
+class FakeProcess:
+    def __init__(self, command, inputs):
+        self.command = command
+        self.inputs = inputs
+        self.stdin = FakeStdin()
+        self.returncode = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.inputs.append((self.command, self.stdin.data))
+
+
+class FakePopen:
+    """Record the input of the commands run through ``subprocess.Popen``"""
+
+    def __init__(self):
+        self.inputs = []
+
+    def __call__(self, command, stdin=None):
+        return FakeProcess(command, self.inputs)
+
+    def get_input(self, pattern):
+        """Return the input of the command matching the given pattern"""
+        return next(
+            data for command, data in self.inputs if pattern in " ".join(command)
+        )
+
+
+@pytest.fixture
+def odoo_archive(tmp_path):
+    backup_path = tmp_path / "backup.zip"
+    with zipfile.ZipFile(backup_path, "w") as backup:
+        backup.writestr("dump.sql", "CREATE TABLE res_partner ();")
+        backup.writestr("manifest.json", "{}")
+        backup.writestr("filestore/ab/abcdef", b"attachment")
+        backup.writestr("filestore/cd/cdef01", b"other attachment")
+    return backup_path
+
+
+@pytest.fixture
+def odoo_cfg():
+    cfg = ConfigParser()
+    cfg.read_string("[options]\ndata_dir = /data/odoo\n")
+    with (
+        patch("odoo_tools.utils.docker_compose.get_version", return_value=[2, 36]),
+        patch("odoo_tools.utils.docker_compose.read_odoo_cfg", return_value=cfg),
+    ):
+        yield cfg
+
+
+@pytest.fixture
+def fake_ddl():
+    with (
+        patch("odoo_tools.utils.db.drop_database") as drop_database,
+        patch("odoo_tools.utils.db.create_database") as create_database,
+    ):
+        yield drop_database, create_database
+
+
+def test_create_db_from_odoo_archive(odoo_archive, odoo_cfg, fake_ddl):
+    fake_popen = FakePopen()
+    with (
+        patch("odoo_tools.utils.os_exec.run"),
+        patch("subprocess.Popen", fake_popen),
+    ):
+        db.create_db_from_odoo_archive("odoodb", odoo_archive)
+    drop_database, create_database = fake_ddl
+    drop_database.assert_called_once_with("odoodb")
+    create_database.assert_called_once_with("odoodb")
+    # psql and tar run through the entrypoint of the image
+    assert all(
+        command[:3] == ["docker", "compose", "run"] for command, _ in fake_popen.inputs
+    )
+    # dump.sql is streamed to psql
+    assert fake_popen.get_input("psql") == b"CREATE TABLE res_partner ();"
+    # the filestore is streamed as a tar archive
+    tar_data = fake_popen.get_input("rm -rf")
+    with tarfile.open(fileobj=io.BytesIO(tar_data)) as tar:
+        assert tar.getnames() == ["ab/abcdef", "cd/cdef01"]
+        attachment = tar.extractfile("ab/abcdef")
+        assert attachment and attachment.read() == b"attachment"
+
+
+def test_create_db_from_odoo_archive_without_dump(tmp_path):
+    backup_path = tmp_path / "backup.zip"
+    with zipfile.ZipFile(backup_path, "w") as backup:
+        backup.writestr("manifest.json", "{}")
+    with pytest.raises(Exit):
+        db.create_db_from_odoo_archive("odoodb", backup_path)
+
+
+@pytest.mark.usefixtures("fake_ddl")
+def test_create_db_from_odoo_archive_incremental_filestore(
+    odoo_archive, odoo_cfg, capsys
+):
+    def os_exec_run(command, **kwargs):
+        if "find" in command[-2]:
+            # ab/abcdef is unchanged, cd/cdef01 changed, ef/ef0123 is stale
+            return "10 ab/abcdef\n3 cd/cdef01\n3 ef/ef0123\n"
+        return ""
+
+    fake_popen = FakePopen()
+    with (
+        patch("odoo_tools.utils.os_exec.run", side_effect=os_exec_run),
+        patch("subprocess.Popen", fake_popen),
+    ):
+        db.create_db_from_odoo_archive(
+            "odoodb", odoo_archive, incremental_filestore=True
+        )
+    assert fake_popen.get_input("psql") == b"CREATE TABLE res_partner ();"
+    assert "1 files to copy, 1 unchanged, 1 removed" in capsys.readouterr().out
+    # stale files are removed, only the missing or changed ones are copied
+    assert fake_popen.get_input("xargs") == b"ef/ef0123"
+    tar_data = fake_popen.get_input("tar -x")
+    assert not any("rm -rf" in " ".join(command) for command, _ in fake_popen.inputs)
+    with tarfile.open(fileobj=io.BytesIO(tar_data)) as tar:
+        assert tar.getnames() == ["cd/cdef01"]
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, sql, params=None):
+        if self.connection.error:
+            raise self.connection.error
+        self.connection.queries.append(sql)
+        self.description = [("dbname",)]
+
+    def fetchall(self):
+        return [(self.connection.dbname,)]
+
+
+class FakeConnection:
+    def __init__(self, dsn):
+        self.dbname = dsn.split("dbname=")[1].split()[0]
+        self.error = FAKE_ERRORS.get(self.dbname)
+        self.queries = []
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+FAKE_ERRORS = {"broken": psycopg2.ProgrammingError("relation does not exist")}
+
+
+@pytest.fixture
+def fake_connect():
+    with (
+        patch("odoo_tools.utils.db.get_db_port", return_value=5432) as get_db_port,
+        patch("psycopg2.connect", side_effect=FakeConnection) as connect,
+    ):
+        connect.get_db_port = get_db_port
+        yield connect
+
+
+def test_connection_manager_reuses_connections(fake_connect):
+    assert db.execute_db_request("odoodb", "SELECT 1") == [("odoodb",)]
+    assert db.execute_db_request("odoodb", "SELECT 2") == [("odoodb",)]
+    assert db.execute_db_request("other", "SELECT 3") == [("other",)]
+    # The port is resolved once, and a connection is opened per database
+    fake_connect.get_db_port.assert_called_once()
+    assert fake_connect.call_count == 2
+    odoodb_connection = db.get_connection_manager()._idle_connections["odoodb"][0]
+    assert odoodb_connection.autocommit
+    assert odoodb_connection.queries == ["SELECT 1", "SELECT 2"]
+    # Closing the connections of a database, e.g: to drop it
+    db.get_connection_manager().close("odoodb")
+    assert odoodb_connection.closed
+    assert "other" in db.get_connection_manager()._idle_connections
+
+
+def test_connection_manager_returns_connections(fake_connect):
+    manager = db.get_connection_manager()
+    # Query errors leave the connection usable: it goes back to the pool
+    with pytest.raises(psycopg2.ProgrammingError):
+        db.execute_db_request("broken", "SELECT 1")
+    assert len(manager._idle_connections["broken"]) == 1
+    # Other errors close it, rather than leaving it open out of the pool
+    with pytest.raises(KeyboardInterrupt), manager.connection("odoodb") as connection:
+        raise KeyboardInterrupt()
+    assert connection.closed
+    assert manager._idle_connections["odoodb"] == []
+
+
+def test_drop_and_create_database(fake_connect):
+    db.execute_db_request("odoodb", "SELECT 1")
+    db.execute_db_request("otools_tpl_abc", "SELECT 1")
+    manager = db.get_connection_manager()
+    odoodb_connection = manager._idle_connections["odoodb"][0]
+    template_connection = manager._idle_connections["otools_tpl_abc"][0]
+    db.drop_database("odoodb")
+    db.create_database("odoodb", template="otools_tpl_abc")
+    # The connections to the dropped and cloned databases are closed first
+    assert odoodb_connection.closed
+    assert template_connection.closed
+    postgres_connection = db.get_connection_manager()._idle_connections["postgres"][0]
+    assert postgres_connection.queries == [
+        sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier("odoodb")),
+        sql.SQL("CREATE DATABASE {}").format(sql.Identifier("odoodb"))
+        + sql.SQL(" TEMPLATE {}").format(sql.Identifier("otools_tpl_abc")),
+    ]
+
+
+def test_execute_db_requests(fake_connect):
+    dbnames = [f"db{i}" for i in range(20)] + ["broken"]
+    res = db.execute_db_requests(
+        dbnames,
+        "SELECT 1",
+        ignored_errors=(psycopg2.ProgrammingError,),
+        max_workers=4,
+    )
+    assert list(res) == dbnames
+    assert res["db3"] == [("db3",)]
+    assert res["broken"] is None
+    fake_connect.get_db_port.assert_called_once()
+    with pytest.raises(psycopg2.ProgrammingError):
+        db.execute_db_requests(["broken"], "SELECT 1")
+
+
+def test_get_marabunta_versions(tmp_path):
+    stats = [("db_a", 101, 10, 2, 0), ("db_b", 102, 5, 0, 0), ("db_c", 103, 0, 0, 0)]
+    version_a = (datetime(2025, 1, 2, 10, 0), "16.0.1.0.0")
+
+    def execute_db_requests(dbnames, sql, **kwargs):
+        if "to_regclass" in sql:
+            # db_c has no marabunta_version table
+            return {name: [(name != "db_c",)] for name in dbnames}
+        return {name: [version_a] if name == "db_a" else [] for name in dbnames}
+
+    with (
+        patch("odoo_tools.utils.db.get_cache_path", return_value=tmp_path),
+        patch("odoo_tools.utils.db.execute_db_request", return_value=stats),
+        patch(
+            "odoo_tools.utils.db.execute_db_requests", side_effect=execute_db_requests
+        ) as mock_requests,
+    ):
+        versions = db.get_marabunta_versions()
+        assert versions == {
+            "db_a": version_a,
+            "db_b": (None, None),
+            "db_c": (None, None),
+        }
+        # The probed databases lacking the table aren't queried
+        assert mock_requests.call_args_list[1].args[0] == ["db_a", "db_b"]
+        # Unchanged databases are read from the cache
+        mock_requests.reset_mock()
+        assert db.get_marabunta_versions() == versions
+        mock_requests.assert_not_called()
+        # Databases written to since are queried again
+        stats[0] = ("db_a", 101, 11, 2, 0)
+        assert db.get_marabunta_versions() == versions
+        assert mock_requests.call_args_list[0].args[0] == ["db_a"]
+        # Unless the cache is disabled
+        mock_requests.reset_mock()
+        assert db.get_marabunta_versions(use_cache=False) == versions
+        assert mock_requests.call_args_list[0].args[0] == ["db_a", "db_b", "db_c"]
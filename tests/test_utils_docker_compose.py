@@ -16,6 +16,8 @@ def test_version():
     )
     with patch("subprocess.run", mock_fn):
         version = docker_compose.get_version()
+        # Resolved once per process
+        assert docker_compose.get_version() is version
     assert version == [2, 36, 2]
 
 
@@ -158,3 +160,111 @@ def test_run_version_2_33():
             "odoo",
             "odoo",
         ]
+
+
+DOCKER_COMPOSE_VERSION_CALL = {
+    "args": ["docker", "compose", "version", "--short"],
+    "stdout": b"2.36.2",
+}
+
+
+def test_run_restore_db_custom_format(tmp_path):
+    dump_path = tmp_path / "prod.pg"
+    dump_path.write_bytes(b"PGDMP\x01\x0e\x00")
+    mock_fn = MockSubprocessRun(
+        [
+            DOCKER_COMPOSE_VERSION_CALL,
+            {
+                "args": [
+                    "docker",
+                    "compose",
+                    "run",
+                    "--rm",
+                    "-T",
+                    "--quiet",
+                    "-v",
+                    f"{tmp_path}:/tmp/otools_restore",
+                    "odoo",
+                    "pg_restore",
+                    "-Oxd",
+                    "odoodb",
+                    "--jobs",
+                    "4",
+                    "/tmp/otools_restore/prod.pg",
+                ],
+            },
+        ]
+    )
+    with patch("subprocess.run", mock_fn):
+        docker_compose.run_restore_db("odoodb", dump_path, jobs=4)
+    mock_fn.assert_completed_calls()
+
+
+def test_run_restore_db_directory_format(tmp_path):
+    dump_path = tmp_path / "prod"
+    dump_path.mkdir()
+    (dump_path / "toc.dat").write_bytes(b"PGDMP")
+    mock_fn = MockSubprocessRun(
+        [
+            DOCKER_COMPOSE_VERSION_CALL,
+            {
+                "args": lambda args: (
+                    args[-4:] == ["odoodb", "--jobs", "2", "/tmp/otools_restore/prod"]
+                ),
+            },
+        ]
+    )
+    with patch("subprocess.run", mock_fn):
+        docker_compose.run_restore_db("odoodb", dump_path, jobs=2)
+    mock_fn.assert_completed_calls()
+
+
+def test_run_restore_db_tar_format(tmp_path):
+    # Tar archives can't be restored in parallel
+    dump_path = tmp_path / "prod.tar"
+    dump_path.write_bytes(b"toc.dat\x00")
+    mock_fn = MockSubprocessRun(
+        [
+            DOCKER_COMPOSE_VERSION_CALL,
+            {
+                "args": lambda args: (
+                    args[-3:] == ["-Oxd", "odoodb", "/tmp/otools_restore/prod.tar"]
+                ),
+            },
+        ]
+    )
+    with patch("subprocess.run", mock_fn):
+        docker_compose.run_restore_db("odoodb", dump_path, jobs=2)
+    mock_fn.assert_completed_calls()
+
+
+def test_run_restore_db_sql(tmp_path):
+    dump_path = tmp_path / "dump.sql"
+    dump_path.write_text("SELECT 1;")
+    calls = []
+    mock_fn = MockSubprocessRun(
+        [
+            DOCKER_COMPOSE_VERSION_CALL,
+            {
+                "args": lambda args: args[-4:] == ["odoo", "psql", "-d", "odoodb"],
+                "sim_call": lambda: calls.append(True),
+            },
+        ]
+    )
+    with patch("subprocess.run", mock_fn):
+        docker_compose.run_restore_db("odoodb", dump_path, format="sql", jobs=2)
+    mock_fn.assert_completed_calls()
+    assert calls
+
+
+def test_run_restore_db_check(tmp_path):
+    dump_path = tmp_path / "dump.sql"
+    dump_path.write_text("SELECT 1;")
+    with (
+        patch("odoo_tools.utils.docker_compose.get_version", return_value=[2, 36]),
+        patch("subprocess.run") as run,
+    ):
+        docker_compose.run_restore_db("odoodb", dump_path, format="sql", check=True)
+    # psql stops at the first error, which fails the restore
+    assert run.call_args.args[0][-2:] == ["-v", "ON_ERROR_STOP=1"]
+    assert run.call_args.kwargs["check"]
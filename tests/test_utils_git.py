@@ -555,3 +555,24 @@ def test_set_remote_url_runs_in_submodule(project):
         cwd=build_path("odoo/external-src/edi"),
         check=True,
     )
+
+
+# ── get_changed_files ─────────────────────────────────────────────────────────
+
+
+@pytest.mark.project_setup(
+    manifest=dict(odoo_version="16.0"),
+    proj_version="16.0.1.0.0",
+    extra_files={"odoo/local-src/addon_a/models.py": "# model\n"},
+    git_init=True,
+)
+def test_get_changed_files_renames(project):
+    repo = git.Repo(".")
+    Path("odoo/local-src/addon_b").mkdir()
+    repo.git.mv("odoo/local-src/addon_a/models.py", "odoo/local-src/addon_b/")
+    repo.git.commit("-m", "Move the model")
+    # Both the addon the file is moved from and the one it's moved to changed
+    assert sorted(git_utils.get_changed_files("HEAD~1..HEAD")) == [
+        Path("odoo/local-src/addon_a/models.py"),
+        Path("odoo/local-src/addon_b/models.py"),
+    ]
@@ -0,0 +1,151 @@
+# Copyright 2026 Camptocamp SA (https://www.camptocamp.com).
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from manifestoo_core.addons_set import AddonsSet
+
+from odoo_tools.utils import manifestoo as manifestoo_utils
+
+from .common import make_fake_addon
+
+
+@pytest.fixture()
+def addons_dirs(runner):
+    """A few addons directories, with valid and invalid addons."""
+    make_fake_addon("repo_a/addon_1", depends=["base"])
+    make_fake_addon("repo_a/addon_2", depends=["addon_1"])
+    make_fake_addon("repo_a/wip_addon", installable=False)
+    make_fake_addon("repo_a/old_addon", manifest_filename="__openerp__.py")
+    make_fake_addon("repo_b/addon_3", depends=["addon_1", "addon_2"])
+    # Shadows the one in repo_a: the last directory wins
+    make_fake_addon("repo_b/addon_1")
+    make_fake_addon("repo_b/broken_addon")
+    Path("repo_b/broken_addon/__manifest__.py").write_text("{'name': ")
+    make_fake_addon("repo_b/no_init_addon")
+    Path("repo_b/no_init_addon/__init__.py").unlink()
+    Path("repo_b/not_an_addon").mkdir()
+    Path("repo_b/README.md").touch()
+    return [Path("repo_a"), Path("repo_b"), Path("missing_repo")]
+
+
+def _as_dict(addons_set):
+    return {
+        name: (addon.manifest_path, addon.manifest.manifest_dict)
+        for name, addon in addons_set.items()
+    }
+
+
+def test_load_addons_set(addons_dirs):
+    expected = AddonsSet()
+    expected.add_from_addons_dirs(addons_dirs)
+    addons_set = manifestoo_utils.load_addons_set(addons_dirs)
+    assert _as_dict(addons_set) == _as_dict(expected)
+    assert sorted(addons_set) == ["addon_1", "addon_2", "addon_3", "old_addon"]
+    assert addons_set["addon_1"].path == Path("repo_b/addon_1")
+
+
+def test_load_addons_set_process_pool(addons_dirs, monkeypatch):
+    monkeypatch.setattr(manifestoo_utils, "PARALLEL_PARSE_THRESHOLD", 0)
+    monkeypatch.setattr(manifestoo_utils.os, "cpu_count", lambda: 2)
+    expected = AddonsSet()
+    expected.add_from_addons_dirs(addons_dirs)
+    addons_set = manifestoo_utils.load_addons_set(addons_dirs, max_workers=1)
+    assert _as_dict(addons_set) == _as_dict(expected)
+
+
+@pytest.fixture()
+def graph(runner):
+    """The dependency graph of a small addons set, missing ``mail``."""
+    make_fake_addon("addons/base")
+    make_fake_addon("addons/web", depends=["base"])
+    make_fake_addon("addons/sale", depends=["web", "mail"])
+    make_fake_addon("addons/sale_ext", depends=["sale"])
+    make_fake_addon("addons/stock", depends=["base"])
+    make_fake_addon("addons/sale_stock", depends=["sale", "stock"])
+    return manifestoo_utils.DependencyGraph(
+        manifestoo_utils.load_addons_set([Path("addons")])
+    )
+
+
+def test_graph_depends(graph):
+    assert graph.depends(["sale"]) == {"web", "mail"}
+    assert graph.depends(["sale"], transitive=True) == {"web", "mail", "base"}
+    assert graph.depends(["sale_stock", "web"], transitive=True) == {
+        "sale",
+        "stock",
+        "web",
+        "mail",
+        "base",
+    }
+    assert graph.depends(["mail"], transitive=True) == set()
+
+
+def test_graph_codepends(graph):
+    assert graph.codepends(["web"], transitive=False) == {"sale"}
+    assert graph.codepends(["web"]) == {"sale", "sale_ext", "sale_stock"}
+    # Batch query, e.g: the addons changed in a diff
+    assert graph.codepends(["stock", "mail"]) == {
+        "sale",
+        "sale_ext",
+        "sale_stock",
+    }
+    assert graph.codepends(["sale_ext"]) == set()
+
+
+def test_graph_closures_memoized(graph):
+    assert graph.codepends(["sale"]) == {"sale_ext", "sale_stock"}
+    # Reuses the closure of `sale` instead of walking the graph again
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setitem(graph._codepends_closures, "sale", frozenset({"fake"}))
+        assert graph.codepends(["web"]) == {"sale", "fake"}
+
+
+def test_graph_topological_order(graph):
+    assert graph.topological_order == [
+        "base",
+        "stock",
+        "web",
+        "sale",
+        "sale_ext",
+        "sale_stock",
+    ]
+
+
+def test_graph_cycle(runner):
+    make_fake_addon("addons/a", depends=["b"])
+    make_fake_addon("addons/b", depends=["a"])
+    make_fake_addon("addons/c", depends=["b"])
+    make_fake_addon("addons/d")
+    graph = manifestoo_utils.DependencyGraph(
+        manifestoo_utils.load_addons_set([Path("addons")])
+    )
+    assert graph.depends(["c"], transitive=True) == {"a", "b"}
+    assert graph.codepends(["a"]) == {"a", "b", "c"}
+    assert graph.topological_order == ["d", "a", "b", "c"]
+
+
+def test_addons_index(addons_dirs):
+    index = manifestoo_utils.AddonsIndex(addons_dirs)
+    # Any module is indexed, even the ones that can't be part of the addons set
+    assert index.locations["addon_1"] == [
+        Path("repo_a/addon_1"),
+        Path("repo_b/addon_1"),
+    ]
+    assert index.locations["wip_addon"] == [Path("repo_a/wip_addon")]
+    assert index.locations["no_init_addon"] == [Path("repo_b/no_init_addon")]
+    assert "not_an_addon" not in index.locations
+    assert index.duplicates == {
+        "addon_1": [Path("repo_a/addon_1"), Path("repo_b/addon_1")]
+    }
+    assert list(index.find("addon_*")) == ["addon_1", "addon_2", "addon_3"]
+    assert list(index.find("addon_[13]")) == ["addon_1", "addon_3"]
+    assert index.find("addon") == {}
+    # Plain module names are looked up, not matched against every module
+    with patch("odoo_tools.utils.manifestoo.fnmatchcase") as fnmatchcase:
+        assert index.find("addon_2") == {"addon_2": [Path("repo_a/addon_2")]}
+        assert index.find("addon") == {}
+    fnmatchcase.assert_not_called()
+    assert sorted(index.addons_set) == ["addon_1", "addon_2", "addon_3", "old_addon"]